@@ -0,0 +1,104 @@
+"""Differentiable counterparts of the Augmentor's ops, to augment generated images inside the gradient tape.
+
+The cv2 py_functions of the other modules cut the gradient. Here the
+geometric ops are per-sample projective transforms in one batched
+tfa.image.transform with bilinear sampling of the reflect-padded images,
+the photometric ops and the color balance are analytic, and cutout fills
+its holes from the pixels around them, passing the gradient straight
+through the mask. Images are in [0, 255] like for the other ops.
+"""
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_addons as tfa
+
+
+def transform(images, **kwargs):
+    """Maps every output pixel of a sample to the input pixel given by its `transforms` matrix.
+
+    The matrices are in pixel coordinates around the image center. The
+    images are reflect-padded, so no empty borders are pulled in.
+    """
+    height, width = kwargs['height'], kwargs['width']
+    pad = max(height, width) // 2
+    center = tf.constant([[1., 0., width / 2 + pad], [0., 1., height / 2 + pad], [0., 0., 1.]])
+    matrices = center @ kwargs['transforms'] @ tf.linalg.inv(center)
+    images = tf.pad(images, [[0, 0], [pad, pad], [pad, pad], [0, 0]], 'REFLECT')
+    images = tfa.image.transform(images, tfa.image.transform_ops.matrices_to_flat_transforms(matrices),
+                                 interpolation='BILINEAR')
+    return images[:, pad:pad + height, pad:pad + width]
+
+
+def rotation_matrices(angles):
+    cos, sin, zero, one = tf.cos(angles), tf.sin(angles), tf.zeros_like(angles), tf.ones_like(angles)
+    return tf.reshape(tf.stack([cos, -sin, zero, sin, cos, zero, zero, zero, one], axis=-1), [-1, 3, 3])
+
+
+def shear_matrices(shear_x, shear_y):
+    zero, one = tf.zeros_like(shear_x), tf.ones_like(shear_x)
+    return tf.reshape(tf.stack([one, shear_x, zero, shear_y, one, zero, zero, zero, one], axis=-1), [-1, 3, 3])
+
+
+def tilt_matrices(tilt_x, tilt_y):
+    zero, one = tf.zeros_like(tilt_x), tf.ones_like(tilt_x)
+    return tf.reshape(tf.stack([one, zero, zero, zero, one, zero, tilt_x, tilt_y, one], axis=-1), [-1, 3, 3])
+
+
+def shift_matrices(shift_x, shift_y):
+    zero, one = tf.zeros_like(shift_x), tf.ones_like(shift_x)
+    return tf.reshape(tf.stack([one, zero, shift_x, zero, one, shift_y, zero, zero, one], axis=-1), [-1, 3, 3])
+
+
+def color_balance(images, percent=2.5):
+    """Stretches every channel until its percent / 2 % darkest and brightest pixels saturate, as Coloring.color_balance."""
+    height, width, channels = images.get_shape().as_list()[1:]
+    n = height * width
+    pixels = tf.sort(tf.reshape(tf.transpose(images, [0, 3, 1, 2]), [-1, channels, n]), axis=-1)
+    low = tf.reshape(pixels[..., int(n * percent / 200.)], [-1, 1, 1, channels])
+    high = tf.reshape(pixels[..., int(n * (1 - percent / 200.)) - 1], [-1, 1, 1, channels])
+    return tf.clip_by_value((images - low) * 255. / tf.maximum(high - low, 1.), 0., 255.)
+
+
+def random_brightness(images, **kwargs):
+    return color_balance(tf.clip_by_value(images + kwargs['magnitude'], 0, 255))
+
+
+def random_saturation(images, **kwargs):
+    images_mean = tf.reduce_mean(images, axis=3, keepdims=True)
+    return color_balance(tf.clip_by_value((images - images_mean) * kwargs['magnitude'] + images_mean, 0, 255))
+
+
+def random_contrast(images, **kwargs):
+    images_mean = tf.reduce_mean(images, axis=[1, 2, 3], keepdims=True)
+    return color_balance(tf.clip_by_value((images - images_mean) * kwargs['magnitude'] + images_mean, 0, 255))
+
+
+# the linear ones of the cv2 conversions of Coloring.flags: channel swap, XYZ, YCrCb and YUV
+COLOR_SPACES = np.array([
+    [[0., 0., 1.], [0., 1., 0.], [1., 0., 0.]],
+    [[0.412453, 0.357580, 0.180423], [0.212671, 0.715160, 0.072169], [0.019334, 0.119193, 0.950227]],
+    [[0.299, 0.587, 0.114], [0.5, -0.4187, -0.0813], [-0.1687, -0.3313, 0.5]],
+    [[0.299, 0.587, 0.114], [-0.1471, -0.2889, 0.4360], [0.6149, -0.5149, -0.1001]],
+], dtype=np.float32)
+COLOR_OFFSETS = np.array([[0., 0., 0.], [0., 0., 0.], [0., 128., 128.], [0., 128., 128.]], dtype=np.float32)
+
+
+def color_space_transform(images, **kwargs):
+    """Blends every sample with itself in the color space `spaces` picks for it, as Coloring.color_space_transform."""
+    matrices = tf.gather(COLOR_SPACES, kwargs['spaces'])
+    offsets = tf.gather(COLOR_OFFSETS, kwargs['spaces'])[:, tf.newaxis, tf.newaxis]
+    converted = color_balance(tf.einsum('bhwc,bdc->bhwd', images, matrices) + offsets)
+    return 0.4 * converted + 0.6 * images
+
+
+def cutout(images, **kwargs):
+    """Fills the holes of `mask` with the average of the pixels around them.
+
+    The gradient passes straight through the mask, so the generator keeps
+    learning from the pixels that were cut out.
+    """
+    mask = kwargs['mask']
+    size = max(kwargs['height'], kwargs['width']) // 2 + 1
+    fill = (tf.nn.avg_pool2d(images * mask, size, 1, 'SAME') /
+            tf.maximum(tf.nn.avg_pool2d(mask, size, 1, 'SAME'), 1e-3))
+    return images + (1 - mask) * tf.stop_gradient(fill - images)
@@ -3,6 +3,10 @@ import tensorflow as tf
 from augmentation.Coloring import enhance_shape
 
 def distort(images, **kwargs):
+    return enhance_shape(warp(images, **kwargs))
+
+
+def warp(images, **kwargs):
     # Similar results to elastic deformation (a bit complex transformation)
     # However, the transformation is much faster that elastic deformation and have a straightforward arguments
     # TODO: Need to adapt reflect padding and eliminate out-of-frame
@@ -33,8 +37,7 @@ def distort(images, **kwargs):
     coord_maps = tf.concat([interp_mapx, interp_mapy], axis=-1)  # [batch_size, height, width, 2]
     images = bilinear_sampling(images, coord_maps)
     images = tf.slice(images, [0, pad_size, pad_size, 0], [-1, kwargs['height'], kwargs['width'], -1])
-    images = tf.image.resize(images, (kwargs['height'], kwargs['width']))
-    return enhance_shape(images)
+    return tf.image.resize(images, (kwargs['height'], kwargs['width']))
 
 
 def bilinear_sampling(photos, coords):
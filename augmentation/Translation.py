@@ -6,6 +6,8 @@ import random
 import numpy as np
 import cv2
 from augmentation.Cutout import inpaint
+from augmentation.Distortion import bilinear_sampling
+from augmentation.np_augmentor import radial_remap_grid
 
 
 def shear_left(images, **kwargs):
@@ -123,31 +125,21 @@ def enhance_shape(images, prc=10):
     return tf.py_function(_py_enhance_shape, [images], tf.float32)
 
 
-def expand_background(images):
+def expand_background(images, k=-1e-5, dx=0., dy=0., in_graph=False):
+    # the remap grid only depends on (H, W, k, dx, dy), so it is built once and shared
+    if in_graph:
+        return _expand_background_graph(images, k, dx, dy)
+
     def _py_extract_background(imgs):
         images = []
-        k = -1
-        dx = 0
-        dy = 0
+        padding = 50
         for i in range(len(imgs)):
             img = cv2.cvtColor(imgs[i].numpy().astype(np.uint8), cv2.IMREAD_COLOR)
             height, width = img.shape[:2]
-            padding = 50
             img = cv2.copyMakeBorder(img, padding, padding, padding, padding, cv2.BORDER_REPLICATE)
             img = cv2.resize(img, (height, width))
 
-            k = k * 0.00001
-            dx = dx * width
-            dy = dy * height
-            x, y = np.mgrid[0:width:1, 0:height:1]
-            x = x.astype(np.float32) - width / 2 - dx
-            y = y.astype(np.float32) - height / 2 - dy
-            theta = np.arctan2(y, x)
-            d = (x * x + y * y) ** 0.5
-            r = d * (1 + k * d * d)
-            map_x = r * np.cos(theta) + width / 2 + dx
-            map_y = r * np.sin(theta) + height / 2 + dy
-
+            map_x, map_y = radial_remap_grid(height, width, k, dx, dy)
             images += [cv2.remap(img, map_y, map_x, interpolation=cv2.INTER_LINEAR,
                                                    borderMode=cv2.BORDER_REPLICATE)]
 
@@ -156,6 +148,20 @@ def expand_background(images):
     return tf.py_function(_py_extract_background, [images], tf.float32)
 
 
+def _expand_background_graph(images, k, dx, dy, padding=50):
+    height, width = images.get_shape().as_list()[1:3]
+    rows = tf.clip_by_value(tf.range(-padding, height + padding), 0, height - 1)
+    cols = tf.clip_by_value(tf.range(-padding, width + padding), 0, width - 1)
+    images = tf.gather(tf.gather(images, rows, axis=1), cols, axis=2)
+    images = tf.image.resize(images, (width, height))
+
+    map_x, map_y = radial_remap_grid(height, width, k, dx, dy)
+    # keep the samples strictly inside the frame, which replicates the borders like cv2.BORDER_REPLICATE
+    coords = np.stack([np.clip(map_y, 0, width - 1.001), np.clip(map_x, 0, height - 1.001)], axis=-1)
+    coords = tf.tile(tf.constant(coords)[None], [tf.shape(images)[0], 1, 1, 1])
+    return bilinear_sampling(images, coords)
+
+
 def fix_bourders(images, **kwargs):
     mask = tf.pad(images, [[0, 0], [kwargs['height'] // 50, kwargs['height'] // 50],
                          [kwargs['width'] // 50, kwargs['width'] // 50], [0, 0]], 'CONSTANT')
@@ -4,6 +4,7 @@ import augmentation.Coloring as color_aug
 import augmentation.Distortion as distort_aug
 import augmentation.Mirror as mirror_aug
 import augmentation.Cutout as cutout_aug
+import augmentation.Differentiable as diff_aug
 import augmentation.Perspective as pres_aug
 import augmentation.Photometric as photo_aug
 import augmentation.Translation as trans_aug
@@ -11,11 +12,13 @@ import numpy as np
 
 
 class Augmentor:
-    def __init__(self):
-        self.augmentation_functions = AUGMENT_FNS
+    # differentiable=True picks the ops that pass the gradient on to the images, to augment generated ones
+    def __init__(self, differentiable=False):
+        self.augmentation_functions = DIFFERENTIABLE_AUGMENT_FNS if differentiable else AUGMENT_FNS
 
     def augment(self, images, batch_shape, scale=255.0,  print_fn=False):
-        ix_lists = np.split(np.arange(batch_shape[0]), max(2, batch_shape[0]//6))
+        # groups of about 6 images, the batch size need not divide evenly
+        ix_lists = np.array_split(np.arange(batch_shape[0]), max(2, batch_shape[0]//6))
         aug_image = []
         for ix_list in ix_lists:
             func_keys = random.sample([*self.augmentation_functions.keys()], random.randint(1, 3))
@@ -33,7 +36,10 @@ class Augmentor:
 
             aug_image += [timg]
 
-        return tf.random.shuffle(tf.concat(aug_image, axis=0))/scale
+        # a gather by shuffled indices, as tf.random.shuffle has no gradient
+        aug_image = tf.gather(tf.concat(aug_image, axis=0), tf.random.shuffle(tf.range(batch_shape[0])))/scale
+        # the py_function ops lose the static shape, which e.g. the critic's LayerNorm needs
+        return tf.ensure_shape(aug_image, batch_shape)
 
 
 def call_fn(fn, images, kwargs):
@@ -349,4 +355,89 @@ AUGMENT_FNS = {
     'shift':   [shift_random],
     'rotate':  [rotate_random]
 }
-#
\ No newline at end of file
+#
+
+
+##############################
+# differentiable ops, see augmentation/Differentiable.py
+
+def shear_transform_random(batch_shape):
+    batch_size, width, height, ch = batch_shape
+    shear = random.choice([a / 1000 for a in range(80, 121)]) * tf.sign(tf.random.uniform([batch_size], -1, 1))
+    on_x = tf.cast(tf.random.uniform([batch_size]) < 0.5, tf.float32)
+    kwargs = {
+        'height': height,
+        'width': width,
+        'transforms': diff_aug.shear_matrices(shear * on_x, shear * (1 - on_x))
+    }
+
+    return diff_aug.transform, kwargs
+
+
+def tilt_transform_random(batch_shape):
+    batch_size, width, height, ch = batch_shape
+    tilt = 0.2 / max(height, width)
+    kwargs = {
+        'height': height,
+        'width': width,
+        'transforms': diff_aug.tilt_matrices(tf.random.uniform([batch_size], -tilt, tilt),
+                                             tf.random.uniform([batch_size], -tilt, tilt))
+    }
+
+    return diff_aug.transform, kwargs
+
+
+def rotate_transform_random(batch_shape):
+    batch_size, width, height, ch = batch_shape
+    kwargs = {
+        'height': height,
+        'width': width,
+        'transforms': diff_aug.rotation_matrices(tf.random.uniform([batch_size], -35, 35) * np.pi / 180)
+    }
+
+    return diff_aug.transform, kwargs
+
+
+def shift_transform_random(batch_shape):
+    batch_size, width, height, ch = batch_shape
+    # as shift_random, a share of the twice as large padded images
+    shift = 2 * random.choice([a / 1000 for a in range(80, 121)])
+    kwargs = {
+        'height': height,
+        'width': width,
+        'transforms': diff_aug.shift_matrices(tf.random.uniform([batch_size], -shift, shift) * width,
+                                              tf.random.uniform([batch_size], -shift, shift) * height)
+    }
+
+    return diff_aug.transform, kwargs
+
+
+def differentiable(factory, fn):
+    """The factory with the parameters of `factory` for the differentiable op `fn`."""
+    def random_fn(batch_shape):
+        _, kwargs = factory(batch_shape)
+        return fn, kwargs
+    random_fn.__name__ = factory.__name__
+    return random_fn
+
+
+def color_space_random(batch_shape):
+    batch_size, width, height, ch = batch_shape
+    kwargs = {'spaces': tf.random.uniform([batch_size], 0, len(diff_aug.COLOR_SPACES), dtype=tf.int32)}
+    return diff_aug.color_space_transform, kwargs
+
+
+DIFFERENTIABLE_AUGMENT_FNS = {
+    'clone':   [clone],
+    'shear':   [shear_transform_random],
+    'tilt':    [tilt_transform_random],
+    'photo':   [differentiable(contrast_random, diff_aug.random_contrast),
+                differentiable(saturation_random, diff_aug.random_saturation),
+                differentiable(brightness_random, diff_aug.random_brightness)],
+    'color':   [color_space_random],
+    'distort': [differentiable(distort_random, distort_aug.warp)],
+    'mirror':  [flip_left_right],
+    'shift':   [shift_transform_random],
+    'rotate':  [rotate_transform_random],
+    'cutout':  [differentiable(cutout_random, diff_aug.cutout)]
+}
@@ -0,0 +1,513 @@
+#
+# NumPy backend of the core AUGMENT_FNS ops.
+#
+# Every op works on a float batch [B, H, W, C] in the [0, 255] range and is
+# vectorized over the batch dimension. Nothing here imports TensorFlow, so the
+# module can be used from multiprocessing data workers and offline pipelines.
+
+from functools import lru_cache
+
+import numpy as np
+
+
+########################
+# sampling helpers
+
+def reflect_pad(images, top, bottom=None, left=None, right=None):
+    bottom = top if bottom is None else bottom
+    left = top if left is None else left
+    right = left if right is None else right
+    return np.pad(images, [[0, 0], [top, bottom], [left, right], [0, 0]], mode='reflect')
+
+
+def resize_bilinear(images, height, width):
+    """Bilinear resize with half pixel centers, same as `tf.image.resize`."""
+    def _weights(in_size, out_size):
+        scale = in_size / out_size
+        coords = (np.arange(out_size, dtype=np.float32) + 0.5) * scale - 0.5
+        coords_f = np.floor(coords)
+        lower = np.maximum(coords_f, 0).astype(np.int64)
+        upper = np.minimum(np.ceil(coords), in_size - 1).astype(np.int64)
+        return lower, upper, (coords - coords_f).astype(np.float32)
+
+    images = np.asarray(images, dtype=np.float32)
+    y0, y1, wy = _weights(images.shape[1], height)
+    x0, x1, wx = _weights(images.shape[2], width)
+
+    top = images[:, y0]
+    bottom = images[:, y1]
+    wy = wy[None, :, None, None]
+    rows = top + (bottom - top) * wy
+
+    left = rows[:, :, x0]
+    right = rows[:, :, x1]
+    wx = wx[None, None, :, None]
+    return left + (right - left) * wx
+
+
+def _read_with_fill(images, ys, xs, fill_value=0.):
+    batch, height, width, _ = images.shape
+    inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+    yc = np.clip(ys, 0, height - 1).astype(np.int64)
+    xc = np.clip(xs, 0, width - 1).astype(np.int64)
+    b = np.arange(batch).reshape([-1] + [1] * (ys.ndim - 1))
+    values = images[b, yc, xc]
+    return np.where(inside[..., None], values, fill_value)
+
+
+def projective_transform(images, transforms, interpolation='BILINEAR', fill_value=0.):
+    """Batched equivalent of `tfa.image.transform` with constant fill.
+
+    transforms: [8] or [B, 8] flat transforms mapping output to input points.
+    """
+    images = np.asarray(images, dtype=np.float32)
+    batch, height, width, _ = images.shape
+    transforms = np.broadcast_to(np.asarray(transforms, dtype=np.float32).reshape(-1, 8), (batch, 8))
+    a0, a1, a2, b0, b1, b2, c0, c1 = [transforms[:, i, None, None] for i in range(8)]
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    k = c0 * x + c1 * y + 1.
+    xs = (a0 * x + a1 * y + a2) / k
+    ys = (b0 * x + b1 * y + b2) / k
+
+    if interpolation == 'NEAREST':
+        # std::round rounds half away from zero
+        xs = np.sign(xs) * np.floor(np.abs(xs) + 0.5)
+        ys = np.sign(ys) * np.floor(np.abs(ys) + 0.5)
+        return _read_with_fill(images, ys, xs, fill_value)
+
+    x_floor = np.floor(xs)
+    y_floor = np.floor(ys)
+    wx1 = (xs - x_floor)[..., None]
+    wy1 = (ys - y_floor)[..., None]
+    value_y_floor = (1. - wx1) * _read_with_fill(images, y_floor, x_floor, fill_value) + \
+                    wx1 * _read_with_fill(images, y_floor, x_floor + 1, fill_value)
+    value_y_ceil = (1. - wx1) * _read_with_fill(images, y_floor + 1, x_floor, fill_value) + \
+                   wx1 * _read_with_fill(images, y_floor + 1, x_floor + 1, fill_value)
+    return ((1. - wy1) * value_y_floor + wy1 * value_y_ceil).astype(np.float32)
+
+
+def matrices_to_flat_transforms(forward_transforms):
+    inverse = np.linalg.inv(np.asarray(forward_transforms, dtype=np.float64))
+    inverse = inverse.reshape(-1, 9)
+    return (inverse[:, :8] / inverse[:, 8:9]).astype(np.float32)
+
+
+def _pad_size(height, width):
+    return int(max(height, width) * (2.0 - 1.0) / 2 + 0.5)  # larger than usual (sqrt(2))
+
+
+def _prepare(images, height, width):
+    images = reflect_pad(np.asarray(images, dtype=np.float32), 5)
+    return resize_bilinear(images, height, width)
+
+
+########################
+# mirror and rotations
+
+def flip_left_right(images, **kwargs):
+    return images[:, :, ::-1]
+
+
+def flip_up_down(images, **kwargs):
+    return images[:, ::-1]
+
+
+def rot90(images):
+    return np.transpose(images[:, :, ::-1], [0, 2, 1, 3])
+
+
+########################
+# shear
+
+def shear_left(images, **kwargs):
+    height, width = kwargs['height'], kwargs['width']
+    images = _prepare(images, height, width)
+
+    pad_size = _pad_size(height, width)
+    images = reflect_pad(images, pad_size)
+    images = reflect_pad(images, pad_size)
+
+    images = projective_transform(images, matrices_to_flat_transforms(
+        [[1.0, kwargs['shear_lambda'], 0], [0, 1.0, 0], [0, 0, 1.0]]))
+    top, left = pad_size * 2, pad_size * 2 + width // 5
+    return images[:, top:top + height, left:left + width]
+
+
+def shear_right(images, **kwargs):
+    return flip_left_right(flip_left_right(shear_left(images, **kwargs)))
+
+
+def shear_rot90(images, **kwargs):
+    return rot90(rot90(rot90(shear_left(rot90(images), **kwargs))))
+
+
+def ishear_left(images, **kwargs):
+    return flip_up_down(shear_left(flip_up_down(images), **kwargs))
+
+
+def ishear_right(images, **kwargs):
+    return flip_up_down(shear_right(flip_up_down(images), **kwargs))
+
+
+def ishear_rot90(images, **kwargs):
+    return flip_up_down(shear_rot90(flip_up_down(images), **kwargs))
+
+
+def shear_left_down(images, **kwargs):
+    height, width = kwargs['height'], kwargs['width']
+    images = _prepare(images, height, width)
+
+    pad_size = _pad_size(height, width)
+    images = reflect_pad(images, pad_size)
+    images = reflect_pad(images, pad_size)
+
+    images = projective_transform(images, matrices_to_flat_transforms(
+        [[1.0, kwargs['shear_lambda2'] + kwargs['shear_lambda1'], 0], [kwargs['shear_lambda1'], 1.0, 0],
+         [0, 0, 1.0]]))
+    top, left = pad_size * 2 + height // 5, pad_size * 2 + width // 3
+    return images[:, top:top + height, left:left + width]
+
+
+def shear_right_down(images, **kwargs):
+    return flip_left_right(flip_left_right(shear_left_down(images, **kwargs)))
+
+
+def shear_rot90_down(images, **kwargs):
+    return rot90(rot90(rot90(shear_left_down(rot90(images), **kwargs))))
+
+
+def ishear_left_down(images, **kwargs):
+    return flip_up_down(shear_left_down(flip_up_down(images), **kwargs))
+
+
+def ishear_right_down(images, **kwargs):
+    return flip_up_down(shear_left_down(flip_up_down(images), **kwargs))
+
+
+def ishear_rot90_down(images, **kwargs):
+    return flip_up_down(shear_left_down(flip_up_down(images), **kwargs))
+
+
+########################
+# perspective
+
+def rotate(images, **kwargs):
+    height, width = kwargs['height'], kwargs['width']
+    images = _prepare(images, height, width)
+    pad_size = _pad_size(height, width)
+    images = reflect_pad(images, pad_size)
+
+    pheight, pwidth = images.shape[1:3]
+    angles = np.asarray(kwargs['angles'], dtype=np.float32).reshape(-1) * np.pi / 180
+    cos, sin = np.cos(angles), np.sin(angles)
+    x_offset = ((pwidth - 1) - (cos * (pwidth - 1) - sin * (pheight - 1))) / 2.0
+    y_offset = ((pheight - 1) - (sin * (pwidth - 1) + cos * (pheight - 1))) / 2.0
+    zeros = np.zeros_like(cos)
+    transforms = np.stack([cos, -sin, x_offset, sin, cos, y_offset, zeros, zeros], axis=1)
+
+    images = projective_transform(images, transforms, interpolation='NEAREST')
+    return images[:, pad_size:pad_size + height, pad_size:pad_size + width]
+
+
+def rand_shift(images, **kwargs):
+    height, width = kwargs['height'], kwargs['width']
+    images = _prepare(images, height, width)
+    pad_size = _pad_size(height, width)
+    images = reflect_pad(images, pad_size)
+
+    batch = np.arange(images.shape[0])[:, None]
+    grid_x = np.clip(np.arange(kwargs['pwidth'])[None] + kwargs['translation_x'] + 1, 0, kwargs['pwidth'] + 1)
+    grid_y = np.clip(np.arange(kwargs['pheight'])[None] + kwargs['translation_y'] + 1, 0, kwargs['pheight'] + 1)
+    images = reflect_pad(images, 1, 1, 0, 0)[batch, grid_x]
+    images = reflect_pad(images, 0, 0, 1, 1)[batch, :, grid_y].transpose([0, 2, 1, 3])
+    return images[:, pad_size:pad_size + height, pad_size:pad_size + width]
+
+
+########################
+# photometric
+
+def color_balance(images, percent=2.5):
+    """Per image and channel histogram stretch, same LUT as `Coloring.color_balance`."""
+    images = np.asarray(images).astype(np.uint8)
+    batch, height, width, ch = images.shape
+    n_pixels = height * width
+
+    channels = images.transpose([0, 3, 1, 2]).reshape(batch * ch, n_pixels).astype(np.int64)
+    offsets = np.arange(batch * ch)[:, None] * 256
+    hist = np.bincount((channels + offsets).ravel(), minlength=batch * ch * 256).reshape(batch * ch, 256)
+    cumhist = np.cumsum(hist, axis=1)
+
+    low_cut = (cumhist < n_pixels * percent / 200.0).sum(axis=1, keepdims=True)
+    high_cut = (cumhist < n_pixels * (1 - percent / 200.0)).sum(axis=1, keepdims=True)
+
+    values = np.arange(256)[None]
+    span = np.maximum(high_cut - low_cut, 1)
+    lut = np.rint((values - low_cut) * 255. / span)
+    lut = np.where(high_cut == low_cut, 0., lut)
+    lut = np.where(values < low_cut, 0., lut)
+    lut = np.where(values > high_cut, 255., lut)
+
+    balanced = np.take_along_axis(lut, channels, axis=1)
+    return balanced.reshape(batch, ch, height, width).transpose([0, 2, 3, 1]).astype(np.float32)
+
+
+def adjust_color(images, prc=2.5):
+    return color_balance(images, prc)
+
+
+def random_brightness(images, **kwargs):
+    images = images + kwargs['magnitude']
+    return adjust_color(np.clip(images, 0, 255))
+
+
+def random_saturation(images, **kwargs):
+    images_mean = np.mean(images, axis=3, keepdims=True)
+    images = (images - images_mean) * kwargs['magnitude'] + images_mean
+    return adjust_color(np.clip(images, 0, 255))
+
+
+def random_contrast(images, **kwargs):
+    images_mean = np.mean(images, axis=(1, 2, 3), keepdims=True)
+    images = (images - images_mean) * kwargs['magnitude'] + images_mean
+    return adjust_color(np.clip(images, 0, 255))
+
+
+########################
+# cutout
+
+def rand_mask(batch_size, height, width, ratio=0.5, rng=np.random):
+    cutout_w, cutout_h = int(width * ratio + 0.5), int(height * ratio + 0.5)
+    offset_x = rng.randint(0, width + (1 - cutout_w % 2), size=[batch_size, 1])
+    offset_y = rng.randint(0, height + (1 - cutout_h % 2), size=[batch_size, 1])
+
+    def _span(offset, size, n):
+        lo = np.clip(offset - size // 2, 0, n - 1)
+        hi = np.clip(offset - size // 2 + size - 1, 0, n - 1)
+        idx = np.arange(n)[None]
+        return (idx >= lo) & (idx <= hi)
+
+    hole = _span(offset_x, cutout_w, width)[:, :, None] & _span(offset_y, cutout_h, height)[:, None, :]
+    return (~hole).astype(np.float32)[..., None]
+
+
+def _box_sum(images):
+    padded = np.pad(images, [[0, 0], [1, 1], [1, 1], [0, 0]], mode='edge')
+    rows = padded[:, :-2] + padded[:, 1:-1] + padded[:, 2:]
+    return rows[:, :, :-2] + rows[:, :, 1:-1] + rows[:, :, 2:]
+
+
+def inpaint(images, masks):
+    """Fills the zero regions of `masks` by peeling the hole from its border inwards.
+
+    A vectorized stand-in for the per image `cv2.inpaint(..., INPAINT_TELEA)`:
+    every pass averages the already known 3x3 neighbours of the hole border.
+    """
+    images = np.asarray(images, dtype=np.float32) * masks
+    known = np.broadcast_to(masks, images.shape).astype(np.float32)
+    for _ in range(max(images.shape[1:3])):
+        if known.min() > 0:
+            break
+        weights = _box_sum(known)
+        fill = _box_sum(images * known) / np.maximum(weights, 1.)
+        border = (known == 0) & (weights > 0)
+        images = np.where(border, fill, images)
+        known = np.where(border, 1., known)
+    return images
+
+
+def cutout(images, **kwargs):
+    images = images * kwargs['mask']
+    return inpaint(images, kwargs['mask'])
+
+
+########################
+# radial background expansion
+
+@lru_cache(maxsize=16)
+def radial_remap_grid(height, width, k=-1e-5, dx=0., dy=0.):
+    """Barrel remap grid of `Translation.expand_background`, cached per parameter set.
+
+    Returns read-only (map_x, map_y) float32 maps shaped [width, height]; map_x
+    indexes rows and map_y columns of the source image.
+    """
+    dx = dx * width
+    dy = dy * height
+    x, y = np.mgrid[0:width:1, 0:height:1]
+    x = x.astype(np.float32) - width / 2 - dx
+    y = y.astype(np.float32) - height / 2 - dy
+    theta = np.arctan2(y, x)
+    d = (x * x + y * y) ** 0.5
+    r = d * (1 + k * d * d)
+    map_x = (r * np.cos(theta) + width / 2 + dx).astype(np.float32)
+    map_y = (r * np.sin(theta) + height / 2 + dy).astype(np.float32)
+    map_x.setflags(write=False)
+    map_y.setflags(write=False)
+    return map_x, map_y
+
+
+def remap_batch(images, map_rows, map_cols):
+    """Bilinear remap of a whole batch with one shared grid and replicated borders."""
+    images = np.asarray(images, dtype=np.float32)
+    height, width = images.shape[1:3]
+    rows = np.clip(map_rows, 0, height - 1)
+    cols = np.clip(map_cols, 0, width - 1)
+    r0 = np.floor(rows).astype(np.int64)
+    c0 = np.floor(cols).astype(np.int64)
+    r1 = np.minimum(r0 + 1, height - 1)
+    c1 = np.minimum(c0 + 1, width - 1)
+    wr = (rows - r0)[None, ..., None]
+    wc = (cols - c0)[None, ..., None]
+
+    top = images[:, r0, c0] * (1. - wc) + images[:, r0, c1] * wc
+    bottom = images[:, r1, c0] * (1. - wc) + images[:, r1, c1] * wc
+    return top * (1. - wr) + bottom * wr
+
+
+def expand_background(images, k=-1e-5, dx=0., dy=0., padding=50):
+    images = np.asarray(images, dtype=np.float32)
+    height, width = images.shape[1:3]
+    images = np.pad(images, [[0, 0], [padding] * 2, [padding] * 2, [0, 0]], mode='edge')
+    images = resize_bilinear(images, width, height)
+    map_x, map_y = radial_remap_grid(height, width, k, dx, dy)
+    return remap_batch(images, map_x, map_y)
+
+
+########################
+# random parameter factories, same ranges as augmentation.augmentor
+
+def _shear_lambda(rng):
+    return rng.choice([a / 1000 for a in range(80, 121)])
+
+
+def clone(batch_shape, rng=np.random):
+    def c(images, **kw):
+        return images
+    return c, {}
+
+
+def brightness_random(batch_shape, rng=np.random):
+    kwargs = {'magnitude': rng.uniform(-100, 100, size=[batch_shape[0], 1, 1, 1]).astype(np.float32)}
+    return random_brightness, kwargs
+
+
+def contrast_random(batch_shape, rng=np.random):
+    kwargs = {'magnitude': rng.uniform(0.5, 1.5, size=[batch_shape[0], 1, 1, 1]).astype(np.float32)}
+    return random_contrast, kwargs
+
+
+def saturation_random(batch_shape, rng=np.random):
+    kwargs = {'magnitude': rng.uniform(0.5, 1.5, size=[batch_shape[0], 1, 1, 1]).astype(np.float32)}
+    return random_saturation, kwargs
+
+
+def rotate_random(batch_shape, rng=np.random):
+    batch_size, width, height, ch = batch_shape
+    kwargs = {'width': width,
+              'height': height,
+              'angles': rng.randint(-35, 36)}
+    return rotate, kwargs
+
+
+def flip_left_right_random(batch_shape, rng=np.random):
+    return flip_left_right, {}
+
+
+def shift_random(batch_shape, rng=np.random):
+    batch_size, width, height, ch = batch_shape
+    pad_size = _pad_size(height, width)
+    pwidth, pheight = width + 2 * pad_size, height + 2 * pad_size
+
+    shift_ratio = rng.choice([a / 1000 for a in range(80, 121)])
+    shift = (int(pwidth * shift_ratio + 0.5), int(pheight * shift_ratio + 0.5))
+    kwargs = {
+        'height': height,
+        'width': width,
+        'pheight': pheight,
+        'pwidth': pwidth,
+        'translation_x': rng.randint(-shift[0], shift[0] + 1, size=[batch_size, 1]),
+        'translation_y': rng.randint(-shift[1], shift[1] + 1, size=[batch_size, 1])
+    }
+    return rand_shift, kwargs
+
+
+def _shear_factory(fn):
+    def factory(batch_shape, rng=np.random):
+        batch_size, width, height, ch = batch_shape
+        return fn, {'height': height, 'width': width, 'shear_lambda': _shear_lambda(rng)}
+    factory.__name__ = f'{fn.__name__}_random'
+    return factory
+
+
+def _shear_down_factory(fn):
+    def factory(batch_shape, rng=np.random):
+        batch_size, width, height, ch = batch_shape
+        return fn, {'height': height, 'width': width,
+                    'shear_lambda1': _shear_lambda(rng), 'shear_lambda2': _shear_lambda(rng)}
+    factory.__name__ = f'{fn.__name__}_random'
+    return factory
+
+
+def cutout_random(batch_shape, rng=np.random):
+    batch_size, width, height, ch = batch_shape
+    r = rng.choice([a / 100 for a in range(10, 26)])
+    kwargs = {
+        'mask': rand_mask(batch_size, height, width, ratio=r, rng=rng),
+        'width': width,
+        'height': height
+    }
+    return cutout, kwargs
+
+
+shear_fns = [_shear_down_factory(ishear_rot90_down), _shear_down_factory(ishear_right_down),
+             _shear_down_factory(ishear_left_down), _shear_down_factory(shear_rot90_down),
+             _shear_down_factory(shear_right_down), _shear_down_factory(shear_left_down),
+             _shear_factory(ishear_rot90), _shear_factory(ishear_right), _shear_factory(ishear_left),
+             _shear_factory(shear_rot90), _shear_factory(shear_right), _shear_factory(shear_left)]
+
+
+NP_AUGMENT_FNS = {
+    'clone':   [clone],
+    'shear':   shear_fns,
+    'photo':   [contrast_random, saturation_random, brightness_random],
+    'mirror':  [flip_left_right_random],
+    'shift':   [shift_random],
+    'rotate':  [rotate_random],
+    'cutout':  [cutout_random]
+}
+
+
+class NpAugmentor:
+    """NumPy counterpart of `augmentation.augmentor.Augmentor`.
+
+    Pass a `seed` per worker process to get independent, reproducible streams.
+    """
+    def __init__(self, augmentation_functions=None, seed=None):
+        self.augmentation_functions = augmentation_functions or NP_AUGMENT_FNS
+        self.rng = np.random.RandomState(seed)
+
+    def augment(self, images, batch_shape=None, scale=255.0, print_fn=False):
+        images = np.asarray(images, dtype=np.float32)
+        batch_shape = batch_shape or images.shape
+        ix_lists = np.array_split(np.arange(batch_shape[0]), max(2, batch_shape[0]//6))
+        keys = [*self.augmentation_functions.keys()]
+        aug_image = []
+        for ix_list in ix_lists:
+            func_keys = self.rng.choice(keys, self.rng.randint(1, 4), replace=False)
+            functions_list = [self.augmentation_functions[k][self.rng.randint(len(self.augmentation_functions[k]))]
+                              for k in func_keys]
+            functions_list = [f([len(ix_list), *batch_shape[1:]], rng=self.rng) for f in functions_list]
+
+            if print_fn:
+                print(str([f.__name__ for f, kw in functions_list]))
+
+            timg = images[ix_list[0]:ix_list[-1]+1]
+            for (f, kw) in functions_list:
+                timg = f(timg, **kw)
+
+            aug_image += [np.asarray(timg, dtype=np.float32)]
+
+        aug_image = np.concatenate(aug_image, axis=0)
+        return aug_image[self.rng.permutation(len(aug_image))] / scale
+
+    __call__ = augment
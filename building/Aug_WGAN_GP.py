@@ -1,258 +1,61 @@
 
-import os
 from functools import partial
-from livelossplot.plot_losses import PlotLosses
-from IPython.display import clear_output
 
 import tensorflow as tf
-import numpy as np
-import pickle
-from tensorflow import random
-from tensorflow.python.keras import layers
-from tensorflow.python.keras import metrics
-from tensorflow.python.keras import models
 
-import building.ops as ops
-from utils.utils import img_merge
-from utils.utils import pbar, vbar
-from utils.utils import save_image_grid
+from building.housekeeping import Housekeeping
+from building.telemetry import timestamp_after
+from building.trainer import WGANTrainer
 from augmentation.augmentor import Augmentor
 
-class Augmented_WGAN_GP:
-    def __init__(self,
-                 model_name,
-                 image_shape,
-                 image_scale=255.0,
-                 save_path=None,
-                 batch_size=36,
-                 z_dim=256,
-                 n_critic=5,
-                 g_penalty=10,
-                 g_lr=0.0001,
-                 d_lr=0.0001):
+class Augmented_WGAN_GP(WGANTrainer):
+    dataset_key = None
+    # the cv2 augmentation of the reals has no XLA kernels
+    xla_reals = False
+    clear_bars = True
 
-        self.model_name = model_name
+    def __init__(self, model_name, image_shape, image_scale=255.0, *args, augment_fakes=False, **kwargs):
+        """See WGANTrainer for the other arguments."""
         self.augmentor = Augmentor()
         self.Augment = self.augmentor.augment
-        self.save_path = save_path
-        self.z_dim = z_dim
-        self.batch_size = batch_size
-        self.image_shape = image_shape
+        # the fakes are augmented like the reals, but by the ops that pass the gradient on to G
+        self.fake_augmentor = Augmentor(differentiable=True) if augment_fakes else None
+        self.xla_fakes = self.fake_augmentor is None
         self.image_scale = image_scale
-        self.n_critic = n_critic
-        self.grad_penalty_weight = g_penalty
-        self.g_opt = ops.AdamOptWrapper(learning_rate=g_lr)
-        self.d_opt = ops.AdamOptWrapper(learning_rate=d_lr)
-
-        self.G = self.build_generator()
-        self.D = self.build_discriminator()
-
-        try:
-            self.G.load_weights(filepath=f'{self.save_path}/{self.model_name}_generator')
-            print('restore generator successfully ... ')
-
-            self.D.load_weights(filepath=f'{self.save_path}/{self.model_name}_discriminator')
-            print('restore discriminator successfully ... ')
-        except:
-            print('unable to restore ... ')
-
-        self.G.summary()
-        self.D.summary()
-
-    def train(self, dataset, val_dataset=None, epochs=int(6e4), n_itr=100, generate_epoch=250, plot_live=False):
-        try:
-            z = tf.constant(np.load(f'{self.save_path}/{self.model_name}_z.npy'))
-        except FileNotFoundError:
-            z = tf.constant(random.normal((self.batch_size, 1, 1, self.z_dim)))
-            os.makedirs(self.save_path, exist_ok=True)
-            np.save(f'{self.save_path}/{self.model_name}_z', z.numpy())
-
-        if plot_live:
-            liveplot = PlotLosses()
-        try:
-            losses_list = pickle.load(open(f'{self.save_path}/{self.model_name}_losses_list.pkl', 'rb'))
-        except:
-            losses_list = []
-
-        if plot_live:
-            for i, losses in enumerate(losses_list):
-                liveplot.update(losses, i)
-        
-        start_epoch = len(losses_list)    
-
-        g_train_loss = metrics.Mean()
-        d_train_loss = metrics.Mean()
-        d_val_loss = metrics.Mean()
-
-
-        for epoch in range(start_epoch, epochs):
-            if not plot_live:
-                clear_output()
-            train_bar = pbar(n_itr, epoch, epochs)
-            for itr_c, batch in zip(range(n_itr), dataset):
-                if train_bar.n >= n_itr:
-                    break
-
-                for _ in range(self.n_critic):
-                    d_loss = self.train_d(batch, image_scale=self.image_scale)
-                    d_train_loss(d_loss)
-
-                g_loss = self.train_g(image_scale=self.image_scale)
-                g_train_loss(g_loss)
-
-                train_bar.postfix['g_loss'] = f'{g_train_loss.result():6.3f}'
-                train_bar.postfix['d_loss'] = f'{d_train_loss.result():6.3f}'
-                train_bar.update(n=itr_c)
-
-            train_bar.close()
-            del train_bar
-
-            if val_dataset is not None:
-                val_bar = vbar(n_itr//5, epoch, epochs)
-                for itr_c, batch in zip(range(n_itr//5), val_dataset):
-                    if val_bar.n >= n_itr//5:
-                        break
-
-                    d_val_l = self.val_d(batch , image_scale=self.image_scale)
-                    d_val_loss(d_val_l)
-
-                    val_bar.postfix['d_val_loss'] = f'{d_val_loss.result():6.3f}'
-                    val_bar.update(n=itr_c)
-                val_bar.close()
-                del val_bar
-
-            losses = {'g_loss': g_train_loss.result(),
-                      'd_loss': d_train_loss.result()
-                      }
-            if val_dataset is not None:
-                losses = {**losses, 'd_val_loss': d_val_loss.result()}
-
-            losses_list += [losses]
-            pickle.dump(losses_list, open(f'{self.save_path}/{self.model_name}_losses_list.pkl', 'wb'))
-            if plot_live:
-                liveplot.update(losses, epoch)
-                liveplot.send()
-
-            g_train_loss.reset_states()
-            d_train_loss.reset_states()
-            if val_dataset is not None:
-                d_val_loss.reset_states()
-
-
-            self.G.save_weights(filepath=f'{self.save_path}/{self.model_name}_generator')
-            self.D.save_weights(filepath=f'{self.save_path}/{self.model_name}_discriminator')
-
-            if epoch >= int(2e4):
-                if epoch%1000 == 0:
-                    self.G.save_weights(filepath=f'{self.save_path}/{self.model_name}_generator{epoch}')
-                    self.D.save_weights(filepath=f'{self.save_path}/{self.model_name}_discriminator{epoch}')
-
-            if epoch%generate_epoch ==1:
-                samples = self.generate_samples(z, image_scale=self.image_scale)
-                img_path = f'{self.save_path}/images/{self.model_name}'
-                os.makedirs(img_path, exist_ok=True)
-                image_grid = img_merge(samples.numpy(), n_rows=6).squeeze()
-                save_image_grid(image_grid, epoch, self.model_name, output_dir=img_path)
-
-
-    @tf.function
-    def train_g(self, image_scale=255.0):
-        z = random.normal((self.batch_size, 1, 1, self.z_dim))
-        with tf.GradientTape() as t:
-            x_fake = self.G(z, training=True) #* image_scale
-            #x_fake, _  = self.Augment(images=x_fake, scale=image_scale, \
-            #                                            batch_shape=[self.batch_size, *self.image_shape])
-            fake_logits= self.D(x_fake, training=True)
-            loss = ops.g_loss_fn(fake_logits)
-        grad = t.gradient(loss, self.G.trainable_variables)
-        self.g_opt.apply_gradients(zip(grad, self.G.trainable_variables))
-        return loss
-
-    @tf.function
-    def train_d(self, x_real, image_scale=255.0):
-        z = random.normal((self.batch_size, 1, 1, self.z_dim))
-        with tf.GradientTape() as t:
-            x_fake = self.G(z, training=True)
-            #flist= None
-            #x_fake, flist = self.Augment(images=x_fake, scale=image_scale, \
-            #                        batch_shape=[self.batch_size, *self.image_shape])
-            fake_logits = self.D(x_fake, training=True)
-            x_real = self.Augment(images=x_real, scale=image_scale, \
-                                     batch_shape=[self.batch_size, *self.image_shape])
-            real_logits = self.D(x_real, training=True)
-            cost = ops.d_loss_fn(fake_logits, real_logits)
-            gp = self.gradient_penalty(partial(self.D, training=True), x_real, x_fake)
-            cost += self.grad_penalty_weight * gp
-        grad = t.gradient(cost, self.D.trainable_variables)
-        self.d_opt.apply_gradients(zip(grad, self.D.trainable_variables))
-        return cost
-
-
-    @tf.function
-    def val_d(self, x_real, image_scale=255.0):
-        z = random.normal((self.batch_size, 1, 1, self.z_dim))
-        x_fake = self.G(z, training=False) * image_scale
-        fake_logits = self.D(x_fake/image_scale, training=False)
-        real_logits = self.D(x_real/image_scale, training=False)
-        cost = ops.d_loss_fn(fake_logits, real_logits)
-        gp = self.gradient_penalty(partial(self.D, training=False), x_real/image_scale, x_fake/image_scale)
-        cost += self.grad_penalty_weight * gp
-        return cost
-
-    def gradient_penalty(self, f, real, fake):
-        alpha = random.uniform([self.batch_size, 1, 1, 1], 0., 1.)
-        diff = fake - real
-        inter = real + (alpha * diff)
-        with tf.GradientTape() as t:
-            t.watch(inter)
-            pred = f(inter)
-        grad = t.gradient(pred, [inter])[0]
-        slopes = tf.sqrt(tf.reduce_sum(tf.square(grad), axis=[1, 2, 3]))
-        gp = tf.reduce_mean((slopes - 1.)**2)
-        return gp
-
-    @tf.function
-    def generate_samples(self, z, image_scale=255.0):
-        """Generates sample images using random values from a Gaussian distribution."""
-        return self.G(z, training=False) * image_scale
-
-
-    def build_generator(self):
-        dim = self.image_shape[0]
-        mult = dim // 8
-
-        x = inputs = layers.Input((1, 1, self.z_dim))
-        x = ops.UpConv2D(dim//2 * mult, 4, 1, 'valid')(x)
-        x = ops.BatchNorm()(x)
-        x = layers.ReLU()(x)
-
-        while mult > 1:
-            x = ops.UpConv2D(dim//2 * (mult // 2))(x)
-            x = ops.BatchNorm()(x)
-            x = layers.ReLU()(x)
-
-            mult //= 2
-
-        x = ops.UpConv2D(3)(x)
-        x = layers.Activation('tanh')(x)
-        return models.Model(inputs, x, name='Generator')
-
-    def build_discriminator(self):
-        dim = self.image_shape[0]
-        mult = 1
-        i = dim // 2
-
-        x = inputs = layers.Input((dim, dim, 3))
-        x = ops.Conv2D(dim//2)(x)
-        x = ops.LeakyRelu()(x)
-
-        while i > 4:
-            x = ops.Conv2D(dim//2 * (2 * mult))(x)
-            x = ops.LayerNorm(axis=[1, 2, 3])(x)
-            x = ops.LeakyRelu()(x)
-
-            i //= 2
-            mult *= 2
-
-        x = ops.Conv2D(1, 4, 1, 'valid')(x)
-        return models.Model(inputs, x, name='Discriminator')
+        super().__init__(model_name, image_shape, *args, **kwargs)
+
+    def build_counters(self):
+        # seconds spent in the augmentation of the real images, for the telemetry
+        self.augment_seconds = tf.Variable(0., trainable=False, dtype=tf.float64,
+                                           aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+        return {'augment': self.augment_seconds}
+
+    def train(self, dataset, val_dataset=None, epochs=int(6e4), n_itr=100, generate_epoch=250, plot_live=False,
+              fused=False, housekeeping=None):
+        housekeeping = housekeeping or Housekeeping.every_epoch(n_itr, samples_epochs=generate_epoch, plot=plot_live)
+        super().train(dataset, val_dataset, epochs=epochs, n_itr=n_itr, fused=fused, housekeeping=housekeeping)
+
+    def write_samples(self, sample_writer, z, epoch):
+        sample_writer.submit(self.generate_samples(z), epoch, self.model_name,
+                             f'{self.save_path}/images/{self.model_name}')
+
+    def augment_reals(self, x_real):
+        augment = partial(self.Augment, scale=self.image_scale,
+                          batch_shape=[self.micro_batch_size, self.resolution, self.resolution, self.image_shape[-1]])
+        if not self.telemetry.enabled:
+            return augment(images=x_real)
+        # the timestamps wait for the augmentation, so they are only traced in with the telemetry on
+        augment_start = timestamp_after(x_real)
+        x_real = augment(images=x_real)
+        self.augment_seconds.assign_add(timestamp_after(x_real) - augment_start)
+        return x_real
+
+    def augment_fakes(self, x_fake):
+        """x_fake through the differentiable augmentation ops, in the pixel range of the reals."""
+        if self.fake_augmentor is None:
+            return x_fake
+        # G's [-1, 1] to the reals' [0, image_scale], which the photometric ops clip to, and back
+        x_fake = self.fake_augmentor.augment(images=(x_fake + 1.) * self.image_scale / 2, scale=self.image_scale,
+                                             batch_shape=[self.micro_batch_size, self.resolution, self.resolution,
+                                                          self.image_shape[-1]])
+        return x_fake * 2 - 1.
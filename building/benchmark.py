@@ -0,0 +1,196 @@
+"""Wall-clock benchmarks for the WGAN trainers.
+
+Times the compiled `train_step` of one model per configuration on synthetic
+data and reports seconds per epoch relative to the first configuration:
+
+    python -m building.benchmark --suite lazy_gp --image_size 64 --batch_size 36
+
+With `--data images.npy` (float images in [-1, 1]) the models train on real
+images, and `--fid` also reports the FID of each model's samples after the
+timed epochs, to compare sample quality along with throughput.
+
+`--suite augmentation` instead compares the images/sec of the augmentation
+pipelines on one batch.
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from building.pipeline import prefetched_iterator
+
+
+def synthetic_dataset(image_size, batch_size, key='images'):
+    images = tf.random.uniform((batch_size * 4, image_size, image_size, 3), -1., 1.)
+    dataset = tf.data.Dataset.from_tensor_slices(images)
+    if key is not None:
+        dataset = dataset.map(lambda x: {key: x})
+    return dataset.batch(batch_size, drop_remainder=True).repeat()
+
+
+def npy_dataset(path, batch_size, key='images'):
+    dataset = tf.data.Dataset.from_tensor_slices(np.load(path).astype(np.float32)).shuffle(1024)
+    if key is not None:
+        dataset = dataset.map(lambda x: {key: x})
+    return dataset.batch(batch_size, drop_remainder=True).repeat()
+
+
+def fid_score(model, real_images, n_samples=1000):
+    from building.mertics import calculate_fid, prepare_inception
+
+    samples = []
+    while sum(len(s) for s in samples) < n_samples:
+        z = tf.random.normal((model.batch_size, 1, 1, model.z_dim))
+        samples.append(model.generate_samples(z).numpy())
+    samples = np.concatenate(samples)[:n_samples]
+    real_images = real_images[np.random.choice(len(real_images), min(n_samples, len(real_images)), replace=False)]
+
+    def _to_inception(images):
+        return tf.image.resize((images + 1.) * 127.5, (299, 299)).numpy()
+
+    inception = prepare_inception((299, 299, 3))
+    return calculate_fid(inception, _to_inception(real_images), _to_inception(samples))
+
+
+def time_per_epoch(model, dataset, key='images', n_itr=100, epochs=3, buffer_size=tf.data.experimental.AUTOTUNE):
+    iterator = prefetched_iterator(dataset, key=key, buffer_size=buffer_size)
+    model.train_step(iterator)  # trace outside of the timed epochs
+
+    times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for _ in range(n_itr):
+            d_loss, g_loss = model.train_step(iterator)
+        d_loss.numpy()
+        times.append(time.perf_counter() - start)
+    return float(np.mean(times))
+
+
+def compare(build_model, configs, dataset, key='images', n_itr=100, epochs=3, real_images=None):
+    """Times every config of `configs` (name -> constructor kwargs) against the first one.
+
+    When `real_images` is given, the FID of each trained model is reported as well.
+    """
+    results = {}
+    for name, kwargs in configs.items():
+        model = build_model(**kwargs)
+        results[name] = {'seconds': time_per_epoch(model, dataset, key, n_itr, epochs)}
+        results[name]['retraces'] = sum(len(causes) for causes in model.traces.causes.values())
+        if real_images is not None:
+            results[name]['fid'] = fid_score(model, real_images)
+
+    baseline = next(iter(results.values()))['seconds']
+    for name, result in results.items():
+        line = f'{name:<28} {result["seconds"]:8.3f} s/epoch  {100 * (result["seconds"] / baseline - 1):+7.1f}%'
+        line += f'  {result["retraces"]} retraces'
+        if 'fid' in result:
+            line += f'  FID {result["fid"]:8.2f}'
+        print(line)
+    return results
+
+
+def augmentation_throughput(image_size, batch_size, repeats=20):
+    """Images/sec of DiffAugment and the differentiable Augmentor, compiled as in the steps, against Augmentor.augment."""
+    from augmentation.augmentor import Augmentor
+    from augmentation.DiffAugment import DiffAugment
+
+    images = tf.random.uniform((batch_size, image_size, image_size, 3), -1., 1.)
+    augmentor = Augmentor()
+    differentiable = Augmentor(differentiable=True)
+    pipelines = {
+        'Augmentor.augment': lambda x: augmentor.augment((x + 1.) * 127.5, batch_shape=x.shape),
+        'Augmentor differentiable': tf.function(lambda x: differentiable.augment((x + 1.) * 127.5,
+                                                                                 batch_shape=x.shape)),
+        'DiffAugment': tf.function(lambda x: DiffAugment(x, policy='color,translation,cutout')),
+    }
+
+    results = {}
+    for name, augment in pipelines.items():
+        augment(images)  # trace outside of the timed repeats
+        start = time.perf_counter()
+        for _ in range(repeats):
+            augmented = augment(images)
+        augmented.numpy()
+        results[name] = repeats * batch_size / (time.perf_counter() - start)
+
+    baseline = next(iter(results.values()))
+    for name, images_per_sec in results.items():
+        print(f'{name:<28} {images_per_sec:10.1f} images/s  {images_per_sec / baseline:6.1f}x')
+    return results
+
+
+def suites(batch_size):
+    return {
+        'lazy_gp': {
+            'gp': {},
+            'gp_concat': {'concat_critic': True},
+            'lazy_gp_4': {'gp_every': 4},
+            'lazy_gp_4_half_batch': {'gp_every': 4, 'gp_batch': batch_size // 2},
+            'lazy_gp_4_concat': {'gp_every': 4, 'concat_critic': True},
+        },
+        'spectral_norm': {
+            'gp': {},
+            'spectral_norm': {'spectral_norm': True},
+        },
+        'mixed_precision': {
+            'float32': {},
+            'mixed_bfloat16': {'precision': 'mixed_bfloat16'},
+        },
+        'xla': {
+            'graph': {},
+            'xla': {'jit_compile': True},
+        },
+        'ema': {
+            'no_ema': {},
+            'ema_0.999': {'ema_decay': 0.999},
+        },
+        'accumulation': {
+            'full_batch': {},
+            'micro_batches_2': {'accumulation_steps': 2},
+            'micro_batches_4': {'accumulation_steps': 4},
+        },
+        'fake_pool': {
+            'fakes_per_update': {},
+            'fake_pool_5': {'fake_pool_size': 5},
+            'fake_pool_1': {'fake_pool_size': 1},
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', default='lazy_gp')
+    parser.add_argument('--image_size', type=int, default=64)
+    parser.add_argument('--batch_size', type=int, default=36)
+    parser.add_argument('--n_itr', type=int, default=100)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--data', default=None, help='.npy file of float images in [-1, 1]')
+    parser.add_argument('--fid', action='store_true', help='report the FID of every model, needs --data')
+    args = parser.parse_args()
+
+    if args.suite == 'augmentation':
+        augmentation_throughput(args.image_size, args.batch_size)
+        return
+
+    from building.WGAN_GP import WGAN_GP
+
+    save_path = tempfile.mkdtemp()
+    image_size = (args.image_size, args.image_size, 3)
+
+    def build_model(**kwargs):
+        return WGAN_GP('benchmark', image_size, save_path=save_path, batch_size=args.batch_size, **kwargs)
+
+    if args.data:
+        dataset = npy_dataset(args.data, args.batch_size)
+    else:
+        dataset = synthetic_dataset(args.image_size, args.batch_size)
+    real_images = np.load(args.data) if args.data and args.fid else None
+    compare(build_model, suites(args.batch_size)[args.suite], dataset, n_itr=args.n_itr, epochs=args.epochs,
+            real_images=real_images)
+
+
+if __name__ == '__main__':
+    main()
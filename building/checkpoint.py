@@ -0,0 +1,61 @@
+import tensorflow as tf
+
+
+class TrainingCheckpoint:
+    """Checkpoints of everything a run needs to resume: models, optimizers, step counter and RNG.
+
+    The last `keep_last` epochs are kept under `latest/`. From epoch
+    `keep_from` on, the first checkpoint at or after every multiple of
+    `keep_every` is also kept for good under `archive/`, so the saves need
+    not land on the multiples. With `async_write` the files are written by a background
+    thread after the variables were copied, so training goes on while they
+    are written. The objects named in `optional` are restored when the
+    checkpoint has them, so a run still resumes after e.g. turning on the
+    EMA of G; all the others have to match.
+    """
+    def __init__(self, directory, keep_last=3, keep_every=1000, keep_from=0, async_write=True, optional=(),
+                 **objects):
+        self.keep_every = keep_every
+        self.keep_from = keep_from
+        objects = {name: obj for name, obj in objects.items() if obj is not None}
+        self.checkpoint = tf.train.Checkpoint(**objects)
+        self.required = tf.train.Checkpoint(**{name: obj for name, obj in objects.items() if name not in optional})
+        self.optional = [name for name in objects if name in optional]
+        # the optional objects the restored checkpoint did not have
+        self.missing = set()
+        self.latest = tf.train.CheckpointManager(self.checkpoint, f'{directory}/latest', max_to_keep=keep_last)
+        self.archive = tf.train.CheckpointManager(self.checkpoint, f'{directory}/archive', max_to_keep=None)
+        self.options = tf.train.CheckpointOptions(experimental_enable_async_checkpoint=async_write)
+        # the epoch of the last archived checkpoint, also of the runs this one resumes
+        self.archived = self.epoch_of(self.archive.latest_checkpoint)
+
+    @staticmethod
+    def epoch_of(path):
+        return None if path is None else int(path.rsplit('-', 1)[-1])
+
+    def save(self, epoch):
+        self.latest.save(checkpoint_number=epoch, options=self.options)
+        if not self.keep_every or epoch < self.keep_from:
+            return
+        if self.archived is None or self.archived < epoch - epoch % self.keep_every:
+            self.archive.save(checkpoint_number=epoch, options=self.options)
+            self.archived = epoch
+
+    def restore(self):
+        """Restores the latest complete checkpoint and returns its epoch, or None if there is none.
+
+        The manager only points to a checkpoint once all of its files are
+        written, so an interrupted save never gets restored.
+        """
+        path = self.latest.latest_checkpoint
+        if path is None:
+            return None
+        self.required.restore(path).assert_existing_objects_matched()
+        self.checkpoint.restore(path).expect_partial()
+        saved = {name.split('/')[0] for name, _ in tf.train.list_variables(path)}
+        self.missing = {name for name in self.optional if name not in saved}
+        return self.epoch_of(path)
+
+    def sync(self):
+        """Waits for the pending background writes."""
+        self.checkpoint.sync()
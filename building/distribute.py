@@ -0,0 +1,50 @@
+"""Helpers to run the WGAN trainers under a `tf.distribute` strategy.
+
+Data parallel over logical CPU devices of one process (call it before any
+other TensorFlow op, `batch_size` is the global batch):
+
+    strategy = mirrored_cpu_strategy(4)
+    gan = WGAN_GP('pokemon', (64, 64, 3), batch_size=144, strategy=strategy)
+
+Multi worker on one host, one process per worker:
+
+    os.environ['TF_CONFIG'] = local_tf_config(num_workers=4, index=rank)
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+"""
+
+import json
+
+import tensorflow as tf
+
+
+def mirrored_cpu_strategy(num_devices):
+    cpu = tf.config.list_physical_devices('CPU')[0]
+    tf.config.set_logical_device_configuration(cpu, [tf.config.LogicalDeviceConfiguration()] * num_devices)
+    devices = [device.name for device in tf.config.list_logical_devices('CPU')]
+    return tf.distribute.MirroredStrategy(devices=devices)
+
+
+def local_tf_config(num_workers, index, base_port=23456):
+    workers = [f'localhost:{base_port + i}' for i in range(num_workers)]
+    return json.dumps({'cluster': {'worker': workers}, 'task': {'type': 'worker', 'index': index}})
+
+
+def is_chief(strategy):
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None or not resolver.task_type:
+        return True
+    return resolver.task_type == 'chief' or (resolver.task_type == 'worker' and resolver.task_id == 0)
+
+
+def worker_id(strategy):
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None or not resolver.task_type:
+        return 0
+    return resolver.task_id
+
+
+def replica_batch_size(strategy, global_batch_size):
+    replicas = strategy.num_replicas_in_sync
+    if global_batch_size % replicas:
+        raise ValueError(f'batch_size {global_batch_size} is not divisible by the {replicas} replicas')
+    return global_batch_size // replicas
@@ -0,0 +1,105 @@
+import json
+import os
+import pickle
+
+import numpy as np
+
+
+class HistoryLog:
+    """Append-only log of the per-epoch losses.
+
+    Every epoch is one fixed-size float64 record (the epoch, then one value
+    per column, NaN when missing) appended to `<path>.bin`. The columns are
+    kept in `<path>.json`. Appends and the next-epoch lookup take constant
+    time, and reads memory-map the file instead of loading all of it.
+    """
+    def __init__(self, path, columns=('g_loss', 'd_loss', 'd_val_loss')):
+        self.path = f'{path}.bin'
+        try:
+            with open(f'{path}.json') as f:
+                self.columns = json.load(f)
+        except FileNotFoundError:
+            self.columns = list(columns)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f'{path}.json', 'w') as f:
+                json.dump(self.columns, f)
+        self.record_size = 8 * (len(self.columns) + 1)
+
+        # drop a record that was only partially written when a run was killed
+        if os.path.exists(self.path) and os.path.getsize(self.path) % self.record_size:
+            os.truncate(self.path, len(self) * self.record_size)
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // self.record_size
+        except FileNotFoundError:
+            return 0
+
+    def _records(self):
+        return np.memmap(self.path, dtype=np.float64, mode='r', shape=(len(self), len(self.columns) + 1))
+
+    def append(self, epoch, losses):
+        record = np.array([epoch] + [float(losses.get(c, np.nan)) for c in self.columns], dtype=np.float64)
+        with open(self.path, 'ab') as f:
+            f.write(record.tobytes())
+
+    def update(self, epoch, losses):
+        """Sets `losses` in the record of `epoch`, or inserts one in epoch order if there is none."""
+        if len(self):
+            records = np.memmap(self.path, dtype=np.float64, mode='r+', shape=(len(self), len(self.columns) + 1))
+            i = int(np.searchsorted(records[:, 0], epoch))
+            if i < len(records) and records[i, 0] == epoch:
+                for c, value in losses.items():
+                    if c in self.columns:
+                        records[i, self.columns.index(c) + 1] = float(value)
+                records.flush()
+                return
+            later = np.array(records[i:])
+            del records
+            os.truncate(self.path, i * self.record_size)
+        else:
+            later = np.zeros((0, len(self.columns) + 1))
+        self.append(epoch, losses)
+        with open(self.path, 'ab') as f:
+            f.write(later.tobytes())
+
+    def next_epoch(self):
+        if not len(self):
+            return 0
+        with open(self.path, 'rb') as f:
+            f.seek(-self.record_size, os.SEEK_END)
+            return int(np.frombuffer(f.read(8), dtype=np.float64)[0]) + 1
+
+    def truncate(self, epoch):
+        """Drops the records of `epoch` and later."""
+        if not len(self):
+            return
+        kept = int(np.searchsorted(self._records()[:, 0], epoch))
+        os.truncate(self.path, kept * self.record_size)
+
+    def tail(self, n):
+        """The last n records as (epochs, {column: values})."""
+        if not len(self):
+            return np.zeros(0), {c: np.zeros(0) for c in self.columns}
+        records = np.array(self._records()[-n:])
+        return records[:, 0].astype(int), {c: records[:, i + 1] for i, c in enumerate(self.columns)}
+
+    def rows(self, max_points=None):
+        """Yields (epoch, losses) with the missing losses left out, every k-th epoch to yield at most max_points."""
+        if not len(self):
+            return
+        records = self._records()
+        if max_points and len(records) > max_points:
+            records = records[::-(-len(records) // max_points)]
+        for record in np.array(records):
+            yield int(record[0]), {c: v for c, v in zip(self.columns, record[1:]) if not np.isnan(v)}
+
+
+def import_losses_list(history, path):
+    """Appends the epochs of an old pickled `losses_list` to an empty history."""
+    if len(history) or not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        losses_list = pickle.load(f)
+    for epoch, losses in enumerate(losses_list):
+        history.append(epoch, losses)
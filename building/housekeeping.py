@@ -0,0 +1,38 @@
+class Housekeeping:
+    """When train() saves checkpoints, logs and plots the losses, validates and writes sample grids.
+
+    Every task runs every `interval` training steps, or never when its
+    interval is None, e.g. for headless runs. Tasks are looked at between the
+    epochs of n_itr steps: one runs after every epoch whose steps contain a
+    multiple of its interval, so intervals below n_itr act once per epoch.
+    The logged losses are the means since the previous log. progress=False
+    also turns off the progress bars.
+    """
+    TASKS = ('checkpoint', 'log', 'plot', 'validation', 'samples')
+
+    def __init__(self, checkpoint=None, log=None, plot=None, validation=None, samples=None, progress=True):
+        self.intervals = {'checkpoint': checkpoint, 'log': log, 'plot': plot, 'validation': validation,
+                          'samples': samples}
+        self.progress = progress
+
+    @classmethod
+    def every_epoch(cls, n_itr, samples_epochs=5, plot=True):
+        """Every task after every epoch and the sample grids every `samples_epochs` epochs."""
+        return cls(checkpoint=n_itr, log=n_itr, plot=n_itr if plot else None, validation=n_itr,
+                   samples=samples_epochs * n_itr)
+
+    @classmethod
+    def headless(cls, checkpoint=None):
+        """Only checkpoints, every `checkpoint` steps, and no progress bars."""
+        return cls(checkpoint=checkpoint, progress=False)
+
+    def enabled(self, task):
+        return self.intervals[task] is not None
+
+    def due(self, task, epoch, n_itr):
+        """Whether `task` runs after `epoch`, i.e. after its steps epoch * n_itr to (epoch + 1) * n_itr - 1."""
+        interval = self.intervals[task]
+        if interval is None:
+            return False
+        first = -(-epoch * n_itr // interval) * interval
+        return first < (epoch + 1) * n_itr
@@ -25,6 +25,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from contextlib import contextmanager
+
+import tensorflow as tf
 from tensorflow import optimizers
 from tensorflow import reduce_mean
 from tensorflow.python.keras import layers
@@ -44,6 +47,44 @@ class Conv2D(layers.Layer):
         return self.conv_op(inputs)
 
 
+class SNConv2D(layers.Layer):
+    """Conv2D with a spectrally normalized kernel, https://arxiv.org/abs/1802.05957.
+
+    The power-iteration vector is a non-trainable variable, so its state stays on the device.
+    """
+    def __init__(self, filters, kernel_size=4, strides=2, padding='same', power_iterations=1):
+        super(SNConv2D, self).__init__()
+        self.filters = filters
+        self.kernel_size = kernel_size
+        self.strides = strides
+        self.padding = padding.upper()
+        self.power_iterations = power_iterations
+
+    def build(self, input_shape):
+        self.kernel = self.add_weight(name='kernel',
+                                      shape=(self.kernel_size, self.kernel_size, input_shape[-1], self.filters),
+                                      initializer='he_normal',
+                                      trainable=True)
+        self.u = self.add_weight(name='sn_u',
+                                 shape=(1, self.filters),
+                                 initializer=tf.random_normal_initializer(),
+                                 trainable=False,
+                                 aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+        super(SNConv2D, self).build(input_shape)
+
+    def call(self, inputs, training=None, **kwargs):
+        w = tf.reshape(self.kernel, [-1, self.filters])
+        u = self.u
+        for _ in range(self.power_iterations):
+            v = tf.math.l2_normalize(tf.matmul(u, w, transpose_b=True))
+            u = tf.math.l2_normalize(tf.matmul(v, w))
+        u, v = tf.stop_gradient(u), tf.stop_gradient(v)
+        sigma = tf.matmul(tf.matmul(v, w), u, transpose_b=True)
+        if training:
+            self.u.assign(tf.cast(u, self.u.dtype))
+        return tf.nn.conv2d(inputs, self.kernel / sigma, strides=self.strides, padding=self.padding)
+
+
 class UpConv2D(layers.Layer):
     def __init__(self, filters, kernel_size=4, strides=2, padding='same'):
         super(UpConv2D, self).__init__()
@@ -59,11 +100,13 @@ class UpConv2D(layers.Layer):
 
 
 class BatchNorm(layers.Layer):
+    # the norm layers always compute in float32, also under a mixed precision policy
     def __init__(self, epsilon=1e-4, axis=-1, momentum=0.99):
-        super(BatchNorm, self).__init__()
+        super(BatchNorm, self).__init__(dtype='float32')
         self.batch_norm = layers.BatchNormalization(epsilon=epsilon,
                                                     axis=axis,
-                                                    momentum=momentum)
+                                                    momentum=momentum,
+                                                    dtype='float32')
 
     def call(self, inputs, **kwargs):
         return self.batch_norm(inputs)
@@ -71,8 +114,8 @@ class BatchNorm(layers.Layer):
 
 class LayerNorm(layers.Layer):
     def __init__(self, epsilon=1e-4, axis=-1):
-        super(LayerNorm, self).__init__()
-        self.layer_norm = layers.LayerNormalization(epsilon=epsilon, axis=axis)
+        super(LayerNorm, self).__init__(dtype='float32')
+        self.layer_norm = layers.LayerNormalization(epsilon=epsilon, axis=axis, dtype='float32')
 
     def call(self, inputs, **kwargs):
         return self.layer_norm(inputs)
@@ -87,6 +130,17 @@ class LeakyRelu(layers.Layer):
         return self.leaky_relu(inputs)
 
 
+class Fade(layers.Layer):
+    """Blends from the first input to the second by the `alpha` variable, to fade new layers in."""
+    def __init__(self, alpha, dtype=None):
+        super(Fade, self).__init__(dtype=dtype)
+        self.alpha = alpha
+
+    def call(self, inputs, **kwargs):
+        old, new = inputs
+        return old + tf.cast(self.alpha, old.dtype) * (new - old)
+
+
 class AdamOptWrapper(optimizers.Adam):
     def __init__(self,
                  learning_rate=1e-4,
@@ -99,6 +153,94 @@ class AdamOptWrapper(optimizers.Adam):
                                              amsgrad, **kwargs)
 
 
+@contextmanager
+def precision_policy(name):
+    """Layers built inside the context use the Keras dtype policy `name`, e.g. 'mixed_bfloat16'."""
+    previous = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy(name)
+    try:
+        yield
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous)
+
+
+def precision_optimizer(optimizer, precision):
+    """Wraps the optimizer for dynamic loss scaling when `precision` computes in float16.
+
+    bfloat16 has the exponent range of float32 and needs no loss scaling.
+    """
+    if tf.keras.mixed_precision.Policy(precision).compute_dtype == 'float16':
+        return tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
+
+def scale_loss(optimizer, loss):
+    if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+        return optimizer.get_scaled_loss(loss)
+    return loss
+
+
+def unscale_gradients(optimizer, grads):
+    if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+        return optimizer.get_unscaled_gradients(grads)
+    return grads
+
+
+def build_optimizer(optimizer, variables):
+    """Creates the slots of all `variables` up front.
+
+    The Keras optimizers of TF >= 2.11 only update the variables they were
+    built for, on their first update unless built before. The legacy ones
+    create their slots lazily and have no `build`.
+    """
+    if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+        optimizer = optimizer.inner_optimizer
+    if hasattr(optimizer, 'build'):
+        optimizer.build(variables)
+
+
+def accumulate_gradients(loss_fn, variables, inputs=None, steps=1):
+    """Gradients of `loss_fn` averaged over `steps` micro-batches of `inputs`.
+
+    `inputs` is a tensor or a nest of them, None entries are passed on to
+    every micro-batch as they are. loss_fn(micro_batch) returns (the loss to
+    differentiate, the loss to report). Each micro-batch only starts once the gradients of the previous
+    one are summed, so peak memory is that of a single micro-batch. Returns
+    the mean reported loss and the mean gradients.
+    """
+    if steps == 1:
+        with tf.GradientTape() as t:
+            loss, report = loss_fn(inputs)
+        return report, t.gradient(loss, variables)
+
+    splits = [tf.split(x, steps) if x is not None else [None] * steps for x in tf.nest.flatten(inputs)]
+    micro_batches = [tf.nest.pack_sequence_as(inputs, list(parts)) for parts in zip(*splits)]
+    report, grads = 0., [tf.zeros_like(v) for v in variables]
+    for micro_batch in micro_batches:
+        with tf.control_dependencies(grads):
+            with tf.GradientTape() as t:
+                micro_loss, micro_report = loss_fn(micro_batch)
+        report += micro_report / steps
+        grads = [g + mg / steps for g, mg in zip(grads, t.gradient(micro_loss, variables))]
+    return report, grads
+
+
+def update_ema(ema_model, model, decay):
+    """Moves the trainable weights of `ema_model` towards those of `model` and copies the others."""
+    def update(*_):
+        for ema_w, w in zip(ema_model.trainable_variables, model.trainable_variables):
+            ema_w.assign_sub((1. - decay) * (ema_w - w))
+        for ema_w, w in zip(ema_model.non_trainable_variables, model.non_trainable_variables):
+            ema_w.assign(w)
+
+    # mirrored variables can only be assigned in cross-replica context
+    replica_context = tf.distribute.get_replica_context()
+    if replica_context is None:
+        update()
+    else:
+        replica_context.merge_call(update)
+
+
 def d_loss_fn(f_logit, r_logit):
     f_loss = reduce_mean(f_logit)
     r_loss = reduce_mean(r_logit)
@@ -108,3 +250,71 @@ def d_loss_fn(f_logit, r_logit):
 def g_loss_fn(f_logit):
     f_loss = -reduce_mean(f_logit)
     return f_loss
+
+
+def interpolate(real, fake, rng):
+    """Random points between real and fake, with alpha drawn from the tf.random.Generator rng."""
+    alpha = rng.uniform([tf.shape(real)[0], 1, 1, 1], 0., 1.)
+    return real + alpha * (fake - real)
+
+
+def penalty_from_grad(grad):
+    grad = tf.cast(grad, tf.float32)
+    slopes = tf.sqrt(tf.reduce_sum(tf.square(grad), axis=[1, 2, 3]))
+    return tf.reduce_mean((slopes - 1.)**2)
+
+
+def concat_critic_forward(f, real, fake, inter):
+    """Runs the critic once over [real, fake, inter] and splits the logits.
+
+    The critic must treat samples independently (no batch statistics),
+    which holds for the LayerNorm critics. Returns (real_logits, fake_logits, gp).
+    """
+    sizes = tf.stack([tf.shape(real)[0], tf.shape(fake)[0], tf.shape(inter)[0]])
+    x = tf.concat([real, fake, inter], axis=0)
+    with tf.GradientTape() as t:
+        t.watch(x)
+        logits = f(x)
+        real_logits, fake_logits, inter_logits = tf.split(logits, sizes, axis=0)
+    grad = t.gradient(inter_logits, x)
+    inter_grad = tf.split(grad, sizes, axis=0)[2]
+    return real_logits, fake_logits, penalty_from_grad(inter_grad)
+
+
+def critic_step(f, real, fake, rng, step=None, concat=False, gp_every=1, gp_batch=None, augment=None, penalty=True):
+    """Critic logits and gradient penalty for one critic update.
+
+    With gp_every > 1 the penalty is only computed when `step` is a multiple
+    of gp_every and is scaled by gp_every (lazy regularization). gp_batch
+    restricts the penalty to the first gp_batch samples. `augment` is applied
+    to the critic inputs but not to the interpolation end points. With
+    penalty=False no penalty is computed at all. The interpolation weights are
+    drawn from the tf.random.Generator rng. Returns (real_logits, fake_logits, gp).
+    """
+    real_in, fake_in = (augment(real), augment(fake)) if augment is not None else (real, fake)
+
+    def with_penalty():
+        p_real, p_fake = (real, fake) if gp_batch is None else (real[:gp_batch], fake[:gp_batch])
+        inter = interpolate(p_real, p_fake, rng)
+        if concat:
+            real_logits, fake_logits, gp = concat_critic_forward(f, real_in, fake_in, inter)
+        else:
+            real_logits, fake_logits = f(real_in), f(fake_in)
+            with tf.GradientTape() as t:
+                t.watch(inter)
+                pred = f(inter)
+            gp = penalty_from_grad(t.gradient(pred, inter))
+        return real_logits, fake_logits, gp * gp_every
+
+    def without_penalty():
+        if concat:
+            real_logits, fake_logits = tf.split(f(tf.concat([real_in, fake_in], axis=0)), 2, axis=0)
+        else:
+            real_logits, fake_logits = f(real_in), f(fake_in)
+        return real_logits, fake_logits, tf.constant(0.)
+
+    if not penalty:
+        return without_penalty()
+    if gp_every == 1:
+        return with_penalty()
+    return tf.cond(tf.equal(step % gp_every, 0), with_penalty, without_penalty)
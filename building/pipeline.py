@@ -0,0 +1,17 @@
+import tensorflow as tf
+
+
+def prefetched_iterator(dataset, key=None, buffer_size=tf.data.experimental.AUTOTUNE, strategy=None):
+    """Returns an endless, prefetched iterator that can be consumed inside a `tf.function`.
+
+    With a `strategy`, the global batches are split into per-replica batches
+    and, across workers, sharded by data.
+    """
+    if key is not None:
+        dataset = dataset.map(lambda batch: batch[key])
+    dataset = dataset.repeat().prefetch(buffer_size)
+    if strategy is not None:
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+        dataset = strategy.experimental_distribute_dataset(dataset.with_options(options))
+    return iter(dataset)
@@ -0,0 +1,126 @@
+import collections
+import glob
+import json
+import os
+import re
+import signal as signals
+from contextlib import contextmanager
+
+import tensorflow as tf
+from tensorflow.core.profiler.protobuf import xplane_pb2
+
+# events of executed TF ops are named "op_name:OpType", unlike the runtime's own
+TF_OP = re.compile(r'[^\s:]+:[^\s:]+')
+
+
+def op_stats(xplane_path):
+    """Total time and calls of every op in a profile, by op ("name:type" for TF ops, kernel name on devices)."""
+    space = xplane_pb2.XSpace()
+    with open(xplane_path, 'rb') as f:
+        space.ParseFromString(f.read())
+
+    stats = collections.defaultdict(lambda: [0, 0.])
+    for plane in space.planes:
+        device = plane.name.startswith('/device:')
+        if not device and not plane.name.startswith('/host:'):
+            continue
+        for line in plane.lines:
+            for event in line.events:
+                name = plane.event_metadata[event.metadata_id].name
+                if device or TF_OP.fullmatch(name):
+                    stats[name][0] += 1
+                    stats[name][1] += event.duration_ps * 1e-9
+    return {name: {'calls': calls, 'ms': ms} for name, (calls, ms) in stats.items()}
+
+
+def top_ops(stats, n=20):
+    """The n slowest ops and op types, e.g. conv kernels or the augmentation's EagerPyFunc."""
+    types = collections.defaultdict(lambda: {'calls': 0, 'ms': 0.})
+    for name, op in stats.items():
+        op_type = name.rsplit(':', 1)[-1]
+        types[op_type]['calls'] += op['calls']
+        types[op_type]['ms'] += op['ms']
+    by_time = lambda items: dict(sorted(items, key=lambda item: -item[1]['ms'])[:n])
+    return {'ops': by_time(stats.items()), 'op_types': by_time(types.items())}
+
+
+class StepProfiler:
+    """Captures tf.profiler traces of chosen training steps.
+
+    `windows` are (epoch, start, stop) tuples, profiling steps start to
+    stop - 1 of that epoch. Sending `signal` (e.g. signal.SIGUSR1) to the
+    process profiles the next `signal_steps` steps instead. Every capture
+    writes the TensorBoard profile under `<log_dir>/plugins/profile/` and
+    the top ops by time to `<log_dir>/top_ops.jsonl`. A capture ends with
+    its epoch at the latest.
+    """
+    def __init__(self, log_dir, windows=(), signal=None, signal_steps=20, n_top=20):
+        self.log_dir = log_dir
+        self.windows = collections.defaultdict(list)
+        for epoch, start, stop in windows:
+            self.windows[epoch].append((start, stop))
+        self.signal_steps = signal_steps
+        self.n_top = n_top
+        self.requested = False
+        self.stop_at = None
+        self.window = None
+        self.global_step = 0
+        if signal is not None:
+            signals.signal(signal, self._request)
+
+    def _request(self, signum, frame):
+        self.requested = True
+
+    def _start(self, epoch, itr, steps):
+        os.makedirs(self.log_dir, exist_ok=True)
+        tf.profiler.experimental.start(self.log_dir)
+        self.window = (epoch, itr)
+        self.stop_at = self.global_step + steps
+
+    def close(self):
+        """Stops a running capture and writes its summary."""
+        if self.window is None:
+            return
+        tf.profiler.experimental.stop()
+        epoch, itr = self.window
+        self.window = None
+
+        runs = sorted(glob.glob(f'{self.log_dir}/plugins/profile/*'))
+        if not runs:
+            # e.g. the profiler could not write its trace, there is nothing to summarize
+            print(f'profiled epoch {epoch} from step {itr}, but found no trace in {self.log_dir}')
+            return
+        stats = collections.defaultdict(lambda: {'calls': 0, 'ms': 0.})
+        for path in glob.glob(f'{runs[-1]}/*.xplane.pb'):
+            for name, op in op_stats(path).items():
+                stats[name]['calls'] += op['calls']
+                stats[name]['ms'] += op['ms']
+        summary = {'epoch': epoch, 'start': itr, 'trace': runs[-1], **top_ops(stats, self.n_top)}
+        with open(f'{self.log_dir}/top_ops.jsonl', 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+        print(f'profiled epoch {epoch} from step {itr} into {runs[-1]}, slowest ops:')
+        for name, op in list(summary['ops'].items())[:5]:
+            print(f'  {op["ms"]:10.2f} ms  {op["calls"]:6d} x  {name}')
+
+    @contextmanager
+    def step(self, epoch, itr):
+        """Wraps one training step, starting and stopping the captures around it."""
+        if self.window is None:
+            for start, stop in self.windows[epoch]:
+                if start <= itr < stop:
+                    self._start(epoch, itr, stop - itr)
+                    break
+            else:
+                if self.requested:
+                    self.requested = False
+                    self._start(epoch, itr, self.signal_steps)
+
+        if self.window is None:
+            yield
+        else:
+            with tf.profiler.experimental.Trace('train', step_num=self.global_step, _r=1):
+                yield
+        self.global_step += 1
+
+        if self.global_step == self.stop_at:
+            self.close()
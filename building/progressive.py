@@ -0,0 +1,155 @@
+import tensorflow as tf
+from tensorflow.python.keras import layers
+from tensorflow.python.keras import models
+
+import building.ops as ops
+
+
+def _split(model, starts):
+    """The layers of a chain model in blocks, each beginning with a layer of type `starts`."""
+    blocks = []
+    for layer in model.layers[1:]:
+        if isinstance(layer, starts) or not blocks:
+            blocks.append([])
+        blocks[-1].append(layer)
+    return blocks
+
+
+def _chain(blocks, x):
+    for block in blocks:
+        for layer in block:
+            x = layer(x)
+    return x
+
+
+def upsample(images):
+    """Nearest-neighbour upsampling by 2, as repeats that XLA can also differentiate."""
+    return tf.repeat(tf.repeat(images, 2, axis=1), 2, axis=2)
+
+
+def _unique(variables):
+    return list({v.ref(): v for v in variables}.values())
+
+
+def grow_generator(G, to_rgb, fade):
+    """(stable, fading) models of every stage of a builder's generator, the last stage being G itself.
+
+    Each block of G doubles the resolution. Stage k runs the first k + 1
+    blocks into a new `to_rgb()` head. Its fading model blends that output
+    in by `fade` against the upsampled output of stage k - 1.
+    """
+    blocks = _split(G, ops.UpConv2D)
+    blocks, heads = blocks[:-1], [to_rgb() for _ in blocks[:-2]] + blocks[-1:]
+
+    z = layers.Input(G.input_shape[1:])
+    x, previous, stages = z, None, []
+    for k, (block, head) in enumerate(zip(blocks, heads)):
+        x = _chain([block], x)
+        image = _chain([head], x)
+        size = image.shape[1]
+        stable = G if k == len(blocks) - 1 else models.Model(z, image, name=f'{G.name}_{size}')
+        fading = None
+        if previous is not None:
+            faded = ops.Fade(fade, dtype='float32')([layers.Lambda(upsample, dtype='float32')(previous), image])
+            fading = models.Model(z, faded, name=f'{G.name}_{size}_fading')
+        stages.append((stable, fading))
+        previous = image
+    return stages
+
+
+def grow_discriminator(D, from_rgb, fade):
+    """(stable, fading) models of every stage of a builder's critic, the last stage being D itself.
+
+    Each block of D halves the resolution. Stage k reads images of the
+    generator's stage k through a new `from_rgb(filters)` head into the last
+    k blocks. Its fading model blends the output of the first of them in by
+    `fade` against the head of stage k - 1 on the downsampled images.
+    """
+    blocks = _split(D, (ops.Conv2D, ops.SNConv2D))
+    blocks, tail = blocks[:-1], blocks[-1]
+    n = len(blocks) - 1
+    # the new heads map into the same shapes as the blocks they replace
+    filters = [block[-1].output.shape[-1] for block in blocks]
+    heads = [from_rgb(filters[n - k]) for k in range(n)] + blocks[:1]
+
+    stages = []
+    for k, head in enumerate(heads):
+        size = D.input_shape[1] // 2**(n - k)
+        images = layers.Input((size, size, D.input_shape[-1]))
+        x = _chain([head], images)
+        stable = D if k == n else models.Model(images, _chain(blocks[n - k + 1:] + [tail], x),
+                                               name=f'{D.name}_{size}')
+        fading = None
+        if k:
+            x = _chain(blocks[n - k + 1:n - k + 2], x)
+            old = _chain([heads[k - 1]], layers.AveragePooling2D()(images))
+            x = ops.Fade(fade)([old, x])
+            fading = models.Model(images, _chain(blocks[n - k + 2:] + [tail], x), name=f'{D.name}_{size}_fading')
+        stages.append((stable, fading))
+    return stages
+
+
+def resize_images(images, size, fade=None):
+    """Average-pools full-resolution images down to `size` pixels.
+
+    While a stage fades in, the images blend by `fade` from their upsampled
+    half-resolution version, as the generator's output does.
+    """
+    factor = images.shape[1] // size
+    if factor > 1:
+        images = tf.nn.avg_pool2d(images, factor, factor, 'VALID')
+    if fade is not None:
+        low = upsample(tf.nn.avg_pool2d(images, 2, 2, 'VALID'))
+        images = low + tf.cast(fade, images.dtype) * (images - low)
+    return images
+
+
+class ProgressiveGrowing(tf.Module):
+    """Trains G and D at a low resolution first and fades their higher-resolution blocks in.
+
+    The builders' networks already grow block by block with the image size.
+    Stage k trains at 8 * 2**k pixels, the last stage at full resolution
+    with G and D themselves. Every stage lasts `epochs_per_stage` epochs and
+    fades its new blocks in during the first half of them.
+    """
+    def __init__(self, G, D, G_ema, to_rgb, from_rgb, epochs_per_stage):
+        super(ProgressiveGrowing, self).__init__(name='progressive_growing')
+        self.epochs_per_stage = epochs_per_stage
+        self.fade_epochs = epochs_per_stage // 2
+        self.fade = tf.Variable(1., trainable=False, aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+        self.G_stages = grow_generator(G, to_rgb, self.fade)
+        self.D_stages = grow_discriminator(D, from_rgb, self.fade)
+        self.G_ema_stages = None
+        if G_ema is not None:
+            self.G_ema_stages = grow_generator(G_ema, to_rgb, self.fade)
+            self.seed_ema()
+
+    def seed_ema(self):
+        """Copies the weights of every generator stage into its EMA."""
+        for (ema, _), (model, _) in zip(self.G_ema_stages, self.G_stages):
+            ops.update_ema(ema, model, decay=0.)
+
+    def generator_variables(self):
+        """The trainable variables of all the generator stages, each once."""
+        return _unique(v for stable, fading in self.G_stages for model in (stable, fading) if model is not None
+                       for v in model.trainable_variables)
+
+    def discriminator_variables(self):
+        """The trainable variables of all the critic stages, each once."""
+        return _unique(v for stable, fading in self.D_stages for model in (stable, fading) if model is not None
+                       for v in model.trainable_variables)
+
+    def stage(self, epoch):
+        """(k, fading) of the stage that trains `epoch`."""
+        k = epoch // self.epochs_per_stage
+        fading = 0 < k < len(self.G_stages) and epoch % self.epochs_per_stage < self.fade_epochs
+        return min(k, len(self.G_stages) - 1), fading
+
+    def models(self, k, fading):
+        """G, D and G_ema of a stage."""
+        pick = lambda stages: stages[k][1 if fading else 0] if stages else None
+        return pick(self.G_stages), pick(self.D_stages), pick(self.G_ema_stages)
+
+    def update(self, epoch, itr, n_itr):
+        """Sets `fade` for iteration `itr` of a fading epoch, reaching 1 with the last one."""
+        self.fade.assign(min((epoch % self.epochs_per_stage + (itr + 1) / n_itr) / self.fade_epochs, 1.))
@@ -0,0 +1,105 @@
+import collections
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+import tensorflow as tf
+
+
+def timestamp_after(x):
+    """Host time in seconds once `x` has been computed, for timing parts of a graph."""
+    with tf.control_dependencies(tf.nest.flatten(x)):
+        return tf.timestamp()
+
+
+def peak_memory_mb():
+    """Peak memory of the GPUs if there are any, otherwise the peak resident memory of the process."""
+    gpus = tf.config.list_logical_devices('GPU')
+    if gpus:
+        return sum(tf.config.experimental.get_memory_info(gpu.name)['peak'] for gpu in gpus) / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class Telemetry:
+    """Per-epoch wall-clock breakdown of a training loop.
+
+    `phase` times host-side phases (data wait, critic and generator steps,
+    housekeeping). `counters` are variables into which the compiled steps add
+    seconds measured in the graph, e.g. the augmentation inside train_d.
+    `end_epoch` appends the seconds of every phase, images/sec and peak
+    memory to `<log_dir>/telemetry.jsonl` and writes them as TensorBoard
+    scalars. A step call returns once its graph ran on CPU; on GPU queued
+    work is billed to the phase that waits for it.
+    """
+    def __init__(self, log_dir, enabled=True, counters=None):
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self.counters = counters or {}
+        self.writer = None
+        self.reset()
+
+    def reset(self):
+        self.seconds = collections.defaultdict(float)
+        self.iterations = 0
+        self.images = 0
+        self.start = time.perf_counter()
+        if self.enabled:
+            self.counter_start = {name: float(counter.numpy()) for name, counter in self.counters.items()}
+            for gpu in tf.config.list_logical_devices('GPU'):
+                tf.config.experimental.reset_memory_stats(gpu.name)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def timed(self, iterable, name='data'):
+        """Yields from `iterable`, timing every fetch as phase `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def iteration(self, images):
+        self.iterations += 1
+        self.images += images
+
+    def end_epoch(self, epoch):
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - self.start
+        seconds = dict(self.seconds)
+        for name, counter in self.counters.items():
+            seconds[name] = float(counter.numpy()) - self.counter_start[name]
+        record = {'epoch': epoch,
+                  'iterations': self.iterations,
+                  'seconds': elapsed,
+                  'images_per_sec': self.images / elapsed,
+                  'peak_memory_mb': peak_memory_mb(),
+                  'phases': seconds}
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(f'{self.log_dir}/telemetry.jsonl', 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        if self.writer is None:
+            self.writer = tf.summary.create_file_writer(self.log_dir)
+        with self.writer.as_default():
+            tf.summary.scalar('telemetry/images_per_sec', record['images_per_sec'], step=epoch)
+            tf.summary.scalar('telemetry/peak_memory_mb', record['peak_memory_mb'], step=epoch)
+            for name, value in seconds.items():
+                tf.summary.scalar(f'telemetry/{name}_seconds', value, step=epoch)
+        self.writer.flush()
+        self.reset()
@@ -0,0 +1,74 @@
+import functools
+
+import tensorflow as tf
+
+
+def _describe_leaf(value):
+    if isinstance(value, (tf.Tensor, tf.Variable)):
+        return tf.TensorSpec(value.shape, value.dtype)
+    if isinstance(value, tf.__internal__.CompositeTensor):
+        # e.g. the PerReplica batches of a strategy, which are new objects every step
+        return tf.type_spec_from_value(value)
+    if hasattr(value, 'element_spec'):
+        return value.element_spec
+    return value
+
+
+def _describe(value):
+    return tf.nest.map_structure(_describe_leaf, value)
+
+
+class TraceCounter:
+    """Counts the traces of every step function and reports each retrace with its cause.
+
+    A retrace means a new graph (and with XLA a new compilation), so after
+    the first steps `causes` should no longer grow during a run.
+    """
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.counts = {}
+        self.causes = {}
+        self.signatures = {}
+
+    def record(self, name, args, kwargs):
+        signature = {**{i: _describe(a) for i, a in enumerate(args)},
+                     **{k: _describe(v) for k, v in kwargs.items()}}
+        previous = self.signatures.get(name)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.signatures[name] = signature
+        if previous is None:
+            return
+
+        changed = [f'{k}: {previous.get(k)} -> {v}' for k, v in signature.items() if previous.get(k) != v]
+        if not changed and self.counts[name] == 2:
+            return  # tf.function traces twice when the first call creates variables, e.g. optimizer slots
+        cause = ', '.join(changed) or 'same arguments, e.g. changed Python globals or attributes'
+        self.causes.setdefault(name, []).append(cause)
+        if self.verbose:
+            print(f'retracing {name} (trace {self.counts[name]}): {cause}')
+
+    def wrap(self, fn, name=None):
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def traced(*args, **kwargs):
+            self.record(name, args, kwargs)
+            return fn(*args, **kwargs)
+        return traced
+
+
+def compile_step(fn, counter, input_signature=None, jit_compile=False, scope=None):
+    """Wraps `fn` in a `tf.function` whose traces are recorded by `counter`.
+
+    The input_signature is only fixed together with jit_compile, which
+    compiles one XLA program per input shape anyway. With a `scope` the
+    traces are counted as `scope/name`, apart from those of other scopes.
+    """
+    name = fn.__name__ if scope is None else f'{scope}/{fn.__name__}'
+    return tf.function(counter.wrap(fn, name), input_signature=input_signature if jit_compile else None,
+                       jit_compile=jit_compile)
+
+
+def inline(step):
+    """The plain Python function of a step built by `compile_step`, for tracing it into another graph."""
+    return step.python_function.__wrapped__
@@ -0,0 +1,572 @@
+"""The training engine shared by the WGAN-GP variants.
+
+WGANTrainer holds the models, optimizers, compiled steps and training
+loop, and builds the DCGAN-like G and D of the variants by default. A
+variant only plugs in what it changes through the hooks: build_generator,
+build_discriminator, build_to_rgb and build_from_rgb, augment_reals and
+augment_fakes, critic_augment, and the dataset_key and image_scale of its
+datasets.
+"""
+
+import os
+from functools import partial
+from livelossplot.plot_losses import PlotLosses
+from IPython.display import clear_output
+
+import tensorflow as tf
+import numpy as np
+from tensorflow import random
+from tensorflow.python.keras import layers
+from tensorflow.python.keras import metrics
+from tensorflow.python.keras import models
+
+import building.ops as ops
+from building.checkpoint import TrainingCheckpoint
+from building.distribute import is_chief, replica_batch_size, worker_id
+from building.history import HistoryLog, import_losses_list
+from building.housekeeping import Housekeeping
+from building.pipeline import prefetched_iterator
+from building.profiling import StepProfiler
+from building.progressive import ProgressiveGrowing, resize_images
+from building.telemetry import Telemetry
+from building.tracing import TraceCounter, compile_step, inline
+from building.validation import AsyncValidator
+from utils.utils import pbar, vbar, NullBar
+from utils.utils import BestModelMonitor
+from utils.utils import SampleWriter
+
+
+class WGANTrainer:
+    # the key of the images in the dataset elements, None when the elements are the images
+    dataset_key = 'images'
+    # the reals are in image_scale times the range of G's outputs
+    image_scale = 1.
+    # applied to the critic inputs but not to the end points of the gradient penalty, see ops.critic_step
+    critic_augment = None
+    # whether augment_reals and augment_fakes can be XLA compiled into train_d and train_g
+    xla_reals = True
+    xla_fakes = True
+    # whether every epoch clears the output of the previous one when the losses are not plotted
+    clear_bars = False
+
+    def __init__(self,
+                 model_name,
+                 image_shape,
+                 save_path=None,
+                 batch_size=36,
+                 z_dim=256,
+                 n_critic=5,
+                 g_penalty=10,
+                 g_lr=0.0001,
+                 d_lr=0.0001,
+                 concat_critic=False,
+                 gp_every=1,
+                 gp_batch=None,
+                 strategy=None,
+                 precision='float32',
+                 jit_compile=False,
+                 keep_last=3,
+                 keep_every=1000,
+                 ema_decay=None,
+                 accumulation_steps=1,
+                 telemetry=False,
+                 profile_windows=(),
+                 profile_signal=None,
+                 progressive_epochs=None,
+                 fake_pool_size=None,
+                 async_validation=False,
+                 early_stopping=None):
+        self.model_name = model_name
+        self.save_path = save_path
+        self.z_dim = z_dim
+        self.batch_size = batch_size
+        self.strategy = strategy or tf.distribute.get_strategy()
+        self.replica_batch_size = replica_batch_size(self.strategy, batch_size)
+        if self.replica_batch_size % accumulation_steps:
+            raise ValueError(f'the per-replica batch of {self.replica_batch_size} is not divisible '
+                             f'into {accumulation_steps} micro-batches')
+        self.accumulation_steps = accumulation_steps
+        self.micro_batch_size = self.replica_batch_size // accumulation_steps
+        self.is_chief = is_chief(self.strategy)
+        self.image_shape = image_shape
+        self.n_critic = n_critic
+        # distinct fake batches generated per generator step in one forward pass, cycled through
+        # by the n_critic critic updates, None to have every update generate its own
+        self.fake_pool_size = fake_pool_size
+        self.grad_penalty_weight = g_penalty
+        self.concat_critic = concat_critic
+        self.gp_every = gp_every
+        self.gp_batch = gp_batch
+        self.precision = precision
+        if jit_compile and self.strategy.num_replicas_in_sync > 1:
+            raise ValueError('jit_compile needs a single replica, the strategy has '
+                             f'{self.strategy.num_replicas_in_sync}')
+        self.jit_compile = jit_compile
+        self.ema_decay = ema_decay
+        self.traces = TraceCounter()
+        # the progressive stage that G, D and the steps are set up for, the full resolution without growing
+        self.stage = None
+        self.resolution = self.image_shape[0]
+        self.fade = None
+        with self.strategy.scope():
+            self.d_step = tf.Variable(0, trainable=False, dtype=tf.int64,
+                                      aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+            self.rng = tf.random.Generator.from_non_deterministic_state()
+            counters = self.build_counters()
+            self.g_opt = ops.precision_optimizer(ops.AdamOptWrapper(learning_rate=g_lr), precision)
+            self.d_opt = ops.precision_optimizer(ops.AdamOptWrapper(learning_rate=d_lr), precision)
+
+            with ops.precision_policy(precision):
+                self.G = self.build_generator()
+                self.D = self.build_discriminator()
+                # on-device moving average of G's weights, sampled from directly
+                self.G_ema = self.build_generator() if ema_decay else None
+                # the lower-resolution stages share the layers of G, D and G_ema
+                self.growing = (ProgressiveGrowing(self.G, self.D, self.G_ema, self.build_to_rgb, self.build_from_rgb,
+                                                   progressive_epochs) if progressive_epochs else None)
+            if self.growing is not None:
+                # the optimizers update the heads of every stage, not only of the first one trained
+                ops.build_optimizer(self.g_opt, self.growing.generator_variables())
+                ops.build_optimizer(self.d_opt, self.growing.discriminator_variables())
+
+            try:
+                self.G.load_weights(filepath=f'{self.save_path}/{self.model_name}_generator')
+                print('restore generator successfully ... ')
+
+                self.D.load_weights(filepath=f'{self.save_path}/{self.model_name}_discriminator')
+                print('restore discriminator successfully ... ')
+            except:
+                print('unable to restore ... ')
+
+            if self.G_ema is not None:
+                ops.update_ema(self.G_ema, self.G, decay=0.)
+
+        # copies of G and D for the validation on a background thread, see AsyncValidator
+        self.val_models = None
+        if async_validation:
+            if self.growing is not None:
+                raise ValueError('async_validation needs fixed models, progressive growing swaps them')
+            with ops.precision_policy(precision):
+                self.val_models = self.build_generator(), self.build_discriminator()
+
+        # stops training after early_stopping validations without a lower validation loss, with G's best weights
+        self.monitor = None
+        if early_stopping is not None:
+            if self.growing is not None or async_validation:
+                raise ValueError('early_stopping needs fixed models validated as they are trained, '
+                                 'without progressive growing or async_validation')
+            self.monitor = BestModelMonitor(self.G, patience=early_stopping)
+
+        if not self.is_chief:
+            # non-chief workers still have to save, but into their own scratch directory
+            self.save_path = f'{self.save_path}/worker_{worker_id(self.strategy)}'
+
+        self.checkpoint = TrainingCheckpoint(f'{self.save_path}/{self.model_name}_checkpoints',
+                                             keep_last=keep_last, keep_every=keep_every, keep_from=int(2e4),
+                                             G=self.G, D=self.D, g_opt=self.g_opt, d_opt=self.d_opt,
+                                             d_step=self.d_step, rng=self.rng, G_ema=self.G_ema,
+                                             growing=self.growing,
+                                             monitor=None if self.monitor is None else self.monitor.state,
+                                             optional=('rng', 'G_ema', 'growing', 'monitor'))
+        self.restored_epoch = self.checkpoint.restore()
+        if self.G_ema is not None and 'G_ema' in self.checkpoint.missing:
+            # the EMA was turned on for a resumed run, it starts from G
+            ops.update_ema(self.G_ema, self.G, decay=0.)
+            if self.growing is not None:
+                self.growing.seed_ema()
+        self.telemetry = Telemetry(f'{self.save_path}/{self.model_name}_telemetry', enabled=telemetry,
+                                   counters=counters)
+        self.profiler = StepProfiler(f'{self.save_path}/{self.model_name}_profile',
+                                     windows=profile_windows, signal=profile_signal)
+        if self.restored_epoch is not None:
+            print(f'restore checkpoint of epoch {self.restored_epoch} successfully ... ')
+
+        self.compile_steps()
+
+        self.G.summary()
+        self.D.summary()
+
+    def build_counters(self):
+        """The telemetry counters of the steps, created in the strategy scope."""
+        return {}
+
+    def compile_steps(self):
+        """Wraps the steps into traced tf.functions, XLA compiled for fixed input shapes with jit_compile.
+
+        Runs again whenever the models change, replacing the steps compiled for the previous ones.
+        """
+        for name in ('train_step', 'batch_step', 'train_g', 'train_d', 'generate_fakes', 'val_d', 'generate_samples'):
+            vars(self).pop(name, None)
+        images = partial(tf.TensorSpec, dtype=tf.float32)
+        # the steps of every progressive stage are traced anew, counted apart from the other stages'
+        scope = None if self.stage is None else f'stage_{self.stage[0]}' + ('_fading' if self.stage[1] else '')
+        step = partial(compile_step, counter=self.traces, jit_compile=self.jit_compile, scope=scope)
+        # steps with augmentation ops that have no XLA kernels stay graphs
+        graph = partial(compile_step, counter=self.traces, scope=scope)
+        self.train_step = compile_step(self.train_step, self.traces, scope=scope)
+        self.batch_step = compile_step(self.batch_step, self.traces, scope=scope)
+        self.train_g = (step if self.xla_fakes else graph)(self.train_g, input_signature=[])
+        fakes = [images((self.replica_batch_size, self.resolution, self.resolution, self.image_shape[-1]))]
+        self.train_d = (step if self.xla_reals and self.xla_fakes else graph)(
+            self.train_d, input_signature=[images((self.replica_batch_size, *self.image_shape))] +
+                                          (fakes if self.fake_pool_size else []))
+        self.generate_fakes = step(self.generate_fakes, input_signature=[])
+        self.val_d = step(self.val_d, input_signature=[images((self.batch_size, *self.image_shape))])
+        self.generate_samples = step(self.generate_samples, input_signature=[images((None, 1, 1, self.z_dim))])
+
+    def grow(self, epoch):
+        """Switches G, D and the steps to the progressive stage that trains `epoch`."""
+        if self.growing is None or self.growing.stage(epoch) == self.stage:
+            return
+        self.stage = self.growing.stage(epoch)
+        self.G, self.D, self.G_ema = self.growing.models(*self.stage)
+        self.resolution = self.D.input_shape[1]
+        self.fade = self.growing.fade if self.stage[1] else None
+        print(f'training at {self.resolution}x{self.resolution}' + (', fading in' if self.fade is not None else ''))
+        self.compile_steps()
+
+    def reals(self, batch):
+        """The real images of a dataset element."""
+        return batch if self.dataset_key is None else batch[self.dataset_key]
+
+    def train(self, dataset, val_dataset=None, epochs=int(3e4), n_itr=100, fused=False, housekeeping=None):
+        housekeeping = housekeeping or Housekeeping.every_epoch(n_itr)
+        try:
+            z = tf.constant(np.load(f'{self.save_path}/{self.model_name}_z.npy'))
+        except FileNotFoundError:
+            z = tf.constant(random.normal((self.batch_size, 1, 1, self.z_dim)))
+            os.makedirs(self.save_path, exist_ok=True)
+            np.save(f'{self.save_path}/{self.model_name}_z', z.numpy())
+
+        history = HistoryLog(f'{self.save_path}/{self.model_name}_history')
+        import_losses_list(history, f'{self.save_path}/{self.model_name}_losses_list.pkl')
+        if self.restored_epoch is not None:
+            # the epochs after the restored checkpoint are trained again
+            history.truncate(self.restored_epoch + 1)
+
+        if housekeeping.enabled('plot'):
+            liveplot = PlotLosses()
+            for i, losses in history.rows(max_points=1000):
+                liveplot.update(losses, i)
+
+        # with sparse logs, the history can end before the checkpoint
+        start_epoch = history.next_epoch() if self.restored_epoch is None else self.restored_epoch + 1
+        sample_writer = SampleWriter(n_rows=6)
+        validator = None
+        if self.val_models is not None and val_dataset is not None:
+            validator = AsyncValidator(self.G, self.D, *self.val_models, self.validation_loss,
+                                       val_dataset, n_itr//5, key=self.dataset_key, counter=self.traces)
+        train_bar_fn, val_bar_fn = (pbar, vbar) if housekeeping.progress else (NullBar, NullBar)
+
+        g_train_loss = metrics.Mean()
+        d_train_loss = metrics.Mean()
+        d_val_loss = metrics.Mean()
+        # (epoch, loss) of the background validations finished since the last log
+        val_results = []
+
+        fused = fused or self.strategy.num_replicas_in_sync > 1
+        if fused:
+            iterator = prefetched_iterator(dataset, key=self.dataset_key, strategy=self.strategy)
+
+        self.telemetry.reset()
+        saved_epoch = None
+        stop = False
+        for epoch in range(start_epoch, epochs):
+            self.grow(epoch)
+            train_step = self.timed_train_step if self.telemetry.enabled else self.train_step
+            if self.clear_bars and housekeeping.progress and not housekeeping.enabled('plot'):
+                clear_output()
+            train_bar = train_bar_fn(n_itr, epoch, epochs)
+            if fused:
+                for itr_c in range(n_itr):
+                    if self.fade is not None:
+                        self.growing.update(epoch, itr_c, n_itr)
+                    with self.profiler.step(epoch, itr_c):
+                        d_loss, g_loss = train_step(iterator)
+                    self.telemetry.iteration(self.batch_size)
+                    d_train_loss(d_loss)
+                    g_train_loss(g_loss)
+
+                    if itr_c % train_bar.miniters == 0:
+                        train_bar.postfix['g_loss'] = f'{g_train_loss.result():6.3f}'
+                        train_bar.postfix['d_loss'] = f'{d_train_loss.result():6.3f}'
+                    train_bar.update(n=itr_c)
+            else:
+                for itr_c, batch in zip(range(n_itr), self.telemetry.timed(dataset)):
+                    if train_bar.n >= n_itr:
+                        break
+
+                    if self.fade is not None:
+                        self.growing.update(epoch, itr_c, n_itr)
+                    with self.profiler.step(epoch, itr_c):
+                        with self.telemetry.phase('critic'):
+                            fakes = self.fake_batches(self.generate_fakes)
+                        for x_fake in fakes:
+                            with self.telemetry.phase('critic'):
+                                d_loss = self.train_d(self.reals(batch), *x_fake)
+                            d_train_loss(d_loss)
+
+                        with self.telemetry.phase('generator'):
+                            g_loss = self.train_g()
+                        g_train_loss(g_loss)
+                    self.telemetry.iteration(self.batch_size)
+
+                    if housekeeping.progress:
+                        train_bar.postfix['g_loss'] = f'{g_train_loss.result():6.3f}'
+                        train_bar.postfix['d_loss'] = f'{d_train_loss.result():6.3f}'
+                    train_bar.update(n=itr_c)
+
+            self.profiler.close()
+            train_bar.close()
+            del train_bar
+
+            with self.telemetry.phase('validation'):
+                if validator is not None:
+                    if housekeeping.due('validation', epoch, n_itr):
+                        validator.submit(epoch)
+                    for val_epoch, d_val_l in validator.results():
+                        d_val_loss(d_val_l)
+                        val_results.append((val_epoch, d_val_l))
+                elif val_dataset is not None and housekeeping.due('validation', epoch, n_itr):
+                    val_bar = val_bar_fn(n_itr//5, epoch, epochs)
+                    val_losses = []
+                    for itr_c, batch in zip(range(n_itr//5), val_dataset):
+                        if val_bar.n >= n_itr//5:
+                            break
+
+                        d_val_l = self.val_d(self.reals(batch))
+                        d_val_loss(d_val_l)
+                        val_losses.append(d_val_l)
+
+                        val_bar.postfix['d_val_loss'] = f'{d_val_loss.result():6.3f}'
+                        val_bar.update(n=itr_c)
+                    val_bar.close()
+                    del val_bar
+                    if self.monitor is not None and val_losses:
+                        stop = self.monitor.update(np.mean(val_losses))
+
+            log, plot = housekeeping.due('log', epoch, n_itr), housekeeping.due('plot', epoch, n_itr)
+            if log or plot:
+                losses = {'g_loss': g_train_loss.result(),
+                          'd_loss': d_train_loss.result()}
+                # validation can run less often than the log
+                if d_val_loss.count > 0:
+                    losses = {**losses, 'd_val_loss': d_val_loss.result()}
+
+            with self.telemetry.phase('history'):
+                if log and validator is None:
+                    history.append(epoch, losses)
+                elif log:
+                    # the background validations are logged under the epochs they validated
+                    history.append(epoch, {k: v for k, v in losses.items() if k != 'd_val_loss'})
+                    for val_epoch, d_val_l in val_results:
+                        history.update(val_epoch, {'d_val_loss': d_val_l})
+            with self.telemetry.phase('plot'):
+                if plot and self.is_chief:
+                    liveplot.update(losses, epoch)
+                    liveplot.send()
+
+            if log or not housekeeping.enabled('log'):
+                g_train_loss.reset_states()
+                d_train_loss.reset_states()
+                d_val_loss.reset_states()
+                val_results.clear()
+
+            with self.telemetry.phase('checkpoint'):
+                if housekeeping.due('checkpoint', epoch, n_itr):
+                    self.checkpoint.save(epoch)
+                    saved_epoch = epoch
+
+            with self.telemetry.phase('samples'):
+                if housekeeping.due('samples', epoch, n_itr) and self.is_chief:
+                    self.write_samples(sample_writer, z, epoch)
+            self.telemetry.end_epoch(epoch)
+            if stop:
+                print(f'stopped early at epoch {epoch}, the best validation loss was {self.monitor.best:.3f}')
+                break
+        if housekeeping.enabled('checkpoint') and start_epoch < epochs and saved_epoch != epoch:
+            # the epochs after the last scheduled checkpoint
+            self.checkpoint.save(epoch)
+        if validator is not None:
+            validator.close()
+            if housekeeping.enabled('log'):
+                # the validations not logged yet, including the ones still running when training ended
+                for val_epoch, d_val_l in val_results + validator.results():
+                    history.update(val_epoch, {'d_val_loss': d_val_l})
+        sample_writer.close()
+        self.checkpoint.sync()
+
+    def write_samples(self, sample_writer, z, epoch):
+        sample_writer.submit(self.generate_samples(z), epoch + 1, self.model_name, f'./images/{self.model_name}')
+
+    def train_step(self, iterator):
+        """Runs the n_critic critic updates and the generator update as one graph."""
+        return inline(self.batch_step)(next(iterator))
+
+    def timed_train_step(self, iterator):
+        """train_step with the wait for the next batch timed apart from the step itself."""
+        with self.telemetry.phase('data'):
+            x_real = next(iterator)
+        with self.telemetry.phase('step'):
+            return self.batch_step(x_real)
+
+    def batch_step(self, x_real):
+        d_loss, g_loss = self.strategy.run(self.replica_step, args=(x_real,))
+        return (self.strategy.reduce(tf.distribute.ReduceOp.MEAN, d_loss, axis=None),
+                self.strategy.reduce(tf.distribute.ReduceOp.MEAN, g_loss, axis=None))
+
+    def replica_step(self, x_real):
+        # a strategy cannot aggregate the gradients from inside a while loop or a nested
+        # tf.function: the critic loop is unrolled and, unless XLA compiled, inlined
+        train_d, train_g, generate_fakes = ((self.train_d, self.train_g, self.generate_fakes) if self.jit_compile
+                                            else (inline(self.train_d), inline(self.train_g),
+                                                  inline(self.generate_fakes)))
+        d_loss = 0.
+        for x_fake in self.fake_batches(generate_fakes):
+            d_loss += train_d(x_real, *x_fake)
+        g_loss = train_g()
+        return d_loss / self.n_critic, g_loss
+
+    def train_g(self):
+        def generator_loss(_):
+            z = self.rng.normal((self.micro_batch_size, 1, 1, self.z_dim))
+            x_fake = self.augment_fakes(self.G(z, training=True))
+            if self.critic_augment is not None:
+                x_fake = self.critic_augment(x_fake)
+            fake_logits = self.D(x_fake, training=True)
+            loss = ops.g_loss_fn(fake_logits)
+            # the cross-replica sum of the gradients is then the gradient of the global mean
+            return ops.scale_loss(self.g_opt, loss / self.strategy.num_replicas_in_sync), loss
+
+        loss, grad = ops.accumulate_gradients(generator_loss, self.G.trainable_variables,
+                                              steps=self.accumulation_steps)
+        grad = ops.unscale_gradients(self.g_opt, grad)
+        self.g_opt.apply_gradients(zip(grad, self.G.trainable_variables))
+        if self.G_ema is not None:
+            ops.update_ema(self.G_ema, self.G, self.ema_decay)
+        return loss
+
+    def train_d(self, x_real, x_fake=None):
+        x_real = resize_images(x_real, self.resolution, self.fade)
+        def critic_loss(batch):
+            x_real, x_fake = batch
+            if x_fake is None:
+                z = self.rng.normal((self.micro_batch_size, 1, 1, self.z_dim))
+                x_fake = self.G(z, training=True)
+            x_fake = self.augment_fakes(x_fake)
+            x_real = self.augment_reals(x_real)
+            real_logits, fake_logits, gp = ops.critic_step(
+                partial(self.D, training=True), x_real, x_fake, self.rng, step=self.d_step, concat=self.concat_critic,
+                gp_every=self.gp_every, gp_batch=self.gp_batch, penalty=self.grad_penalty_weight > 0,
+                augment=self.critic_augment)
+            cost = ops.d_loss_fn(fake_logits, real_logits)
+            cost += self.grad_penalty_weight * gp
+            # the cross-replica sum of the gradients is then the gradient of the global mean
+            return ops.scale_loss(self.d_opt, cost / self.strategy.num_replicas_in_sync), cost
+
+        cost, grad = ops.accumulate_gradients(critic_loss, self.D.trainable_variables, (x_real, x_fake),
+                                              steps=self.accumulation_steps)
+        grad = ops.unscale_gradients(self.d_opt, grad)
+        self.d_opt.apply_gradients(zip(grad, self.D.trainable_variables))
+        self.d_step.assign_add(1)
+        return cost
+
+    def augment_reals(self, x_real):
+        """A micro-batch of reals as the critic sees them, in the range of G's outputs."""
+        return x_real
+
+    def augment_fakes(self, x_fake):
+        """A micro-batch of fakes as the critic sees them, keeping the gradient to G."""
+        return x_fake
+
+    def generate_fakes(self):
+        """The fake pool of one generator step, as fake_pool_size batches of a single forward pass of G."""
+        z = self.rng.normal((self.fake_pool_size * self.replica_batch_size, 1, 1, self.z_dim))
+        return tf.split(self.G(z, training=True), self.fake_pool_size)
+
+    def fake_batches(self, generate_fakes):
+        """The extra train_d arguments of each of the n_critic critic updates."""
+        if not self.fake_pool_size:
+            return [()] * self.n_critic
+        fakes = generate_fakes()
+        return [(fakes[i % self.fake_pool_size],) for i in range(self.n_critic)]
+
+    def val_d(self, x_real):
+        return self.validation_loss(self.G, self.D, self.rng, x_real)
+
+    def validation_loss(self, G, D, rng, x_real):
+        """The validation loss of G and D, which are the trained models or snapshots of them."""
+        x_real = resize_images(x_real, self.resolution, self.fade) / self.image_scale
+        z = rng.normal((self.batch_size, 1, 1, self.z_dim))
+        x_fake = G(z, training=False)
+        fake_logits = D(x_fake, training=False)
+        real_logits = D(x_real, training=False)
+        cost = ops.d_loss_fn(fake_logits, real_logits)
+        if self.grad_penalty_weight > 0:
+            gp = self.gradient_penalty(partial(D, training=False), x_real, x_fake, rng)
+            cost += self.grad_penalty_weight * gp
+        return cost
+
+    def gradient_penalty(self, f, real, fake, rng):
+        inter = ops.interpolate(real, fake, rng)
+        with tf.GradientTape() as t:
+            t.watch(inter)
+            pred = f(inter)
+        grad = t.gradient(pred, [inter])[0]
+        slopes = tf.sqrt(tf.reduce_sum(tf.square(grad), axis=[1, 2, 3]))
+        gp = tf.reduce_mean((slopes - 1.)**2)
+        return gp
+
+    def generate_samples(self, z):
+        """Generates sample images using random values from a Gaussian distribution."""
+        G = self.G if self.G_ema is None else self.G_ema
+        return G(z, training=False) * self.image_scale
+
+    def build_generator(self):
+        dim = self.image_shape[0]
+        mult = dim // 8
+
+        x = inputs = layers.Input((1, 1, self.z_dim))
+        x = ops.UpConv2D(dim//2 * mult, 4, 1, 'valid')(x)
+        x = ops.BatchNorm()(x)
+        x = layers.ReLU()(x)
+
+        while mult > 1:
+            x = ops.UpConv2D(dim//2 * (mult // 2))(x)
+            x = ops.BatchNorm()(x)
+            x = layers.ReLU()(x)
+
+            mult //= 2
+
+        x = ops.UpConv2D(3)(x)
+        x = layers.Activation('tanh', dtype='float32')(x)
+        return models.Model(inputs, x, name='Generator')
+
+    def build_discriminator(self):
+        dim = self.image_shape[0]
+        mult = 1
+        i = dim // 2
+
+        x = inputs = layers.Input((dim, dim, 3))
+        x = ops.Conv2D(dim//2)(x)
+        x = ops.LeakyRelu()(x)
+
+        while i > 4:
+            x = ops.Conv2D(dim//2 * (2 * mult))(x)
+            x = ops.LayerNorm(axis=[1, 2, 3])(x)
+            x = ops.LeakyRelu()(x)
+
+            i //= 2
+            mult *= 2
+
+        x = ops.Conv2D(1, 4, 1, 'valid')(x)
+        x = layers.Activation('linear', dtype='float32')(x)
+        return models.Model(inputs, x, name='Discriminator')
+
+    def build_to_rgb(self):
+        """Output head of a lower-resolution generator stage, as G's own."""
+        return [ops.UpConv2D(3), layers.Activation('tanh', dtype='float32')]
+
+    def build_from_rgb(self, filters):
+        """Input head of a lower-resolution critic stage, as D's own."""
+        return [ops.Conv2D(filters), ops.LeakyRelu()]
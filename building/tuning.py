@@ -0,0 +1,125 @@
+"""Finds the fastest batch size, n_critic and prefetch depth of a trainer that fit on this host.
+
+    python -m building.tuning --model WGAN_GP --image_size 64 --n_critic 5 --memory_mb 8000
+
+For every n_critic the batch size doubles from --min_batch until a
+configuration runs out of memory, exceeds --memory_mb or reaches
+--max_batch. The prefetch depths are then compared at the fastest batch
+size. Every configuration trains on synthetic data in a fresh process, so
+its peak memory is its own and running out of memory only ends that probe.
+Images/sec count the real images consumed; a larger n_critic trains the
+critic more per image, so compare its results for speed, not for
+equivalence.
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import tensorflow as tf
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def _probe(model, image_size, batch_size, n_critic, buffer_size, n_itr, epochs):
+    from building.benchmark import synthetic_dataset, time_per_epoch
+    from building.telemetry import peak_memory_mb
+
+    image_shape = (image_size, image_size, 3)
+    try:
+        if model == 'WGAN_GP':
+            from building.WGAN_GP import WGAN_GP
+            trainer = WGAN_GP('tuning', image_shape, save_path=tempfile.mkdtemp(), batch_size=batch_size,
+                              n_critic=n_critic)
+            dataset, key = synthetic_dataset(image_size, batch_size), 'images'
+        else:
+            from building.Aug_WGAN_GP import Augmented_WGAN_GP
+            trainer = Augmented_WGAN_GP('tuning', image_shape, save_path=tempfile.mkdtemp(), batch_size=batch_size,
+                                        n_critic=n_critic)
+            # the augmented trainer reads images in [0, image_scale]
+            dataset = synthetic_dataset(image_size, batch_size, key=None).map(lambda x: (x + 1.) * 127.5)
+            key = None
+        seconds = time_per_epoch(trainer, dataset, key, n_itr, epochs, buffer_size)
+    except tf.errors.ResourceExhaustedError:
+        return None
+    return {'images_per_sec': batch_size * n_itr / seconds, 'peak_memory_mb': peak_memory_mb()}
+
+
+def probe(model, image_size, batch_size, n_critic, buffer_size=AUTOTUNE, n_itr=20, epochs=2):
+    """{'images_per_sec', 'peak_memory_mb'} of one configuration, None when it ran out of memory or failed."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        try:
+            return pool.submit(_probe, model, image_size, batch_size, n_critic, buffer_size, n_itr, epochs).result()
+        except BrokenProcessPool:
+            # the process was killed, e.g. by the out-of-memory killer
+            return None
+        except Exception as e:
+            # any other failure only rules out this configuration, not the whole sweep
+            print(f'{describe({"batch_size": batch_size, "n_critic": n_critic, "buffer_size": buffer_size})} '
+                  f'failed: {type(e).__name__}: {e}')
+            return None
+
+
+def tune(model, image_size, n_critics=(5,), buffer_sizes=(1, 2, AUTOTUNE), min_batch=8, max_batch=1024,
+         memory_mb=None, n_itr=20, epochs=2):
+    """Probes the configurations and returns (recommended config, results of all probed ones)."""
+    def fits(result):
+        return result is not None and (memory_mb is None or result['peak_memory_mb'] <= memory_mb)
+
+    results = []
+    for n_critic in n_critics:
+        batch_size, fastest = min_batch, None
+        while batch_size <= max_batch:
+            result = probe(model, image_size, batch_size, n_critic, AUTOTUNE, n_itr, epochs)
+            if not fits(result):
+                break
+            results.append(({'batch_size': batch_size, 'n_critic': n_critic, 'buffer_size': AUTOTUNE}, result))
+            if fastest is None or result['images_per_sec'] > fastest[1]['images_per_sec']:
+                fastest = results[-1]
+            batch_size *= 2
+        if fastest is None:
+            continue
+        for buffer_size in buffer_sizes:
+            if buffer_size == AUTOTUNE:
+                continue
+            result = probe(model, image_size, fastest[0]['batch_size'], n_critic, buffer_size, n_itr, epochs)
+            if fits(result):
+                results.append(({**fastest[0], 'buffer_size': buffer_size}, result))
+
+    for config, result in results:
+        print(f'{describe(config)} {result["images_per_sec"]:10.1f} images/s {result["peak_memory_mb"]:10.1f} MB')
+    if not results:
+        print(f'no configuration from batch size {min_batch} on fits')
+        return None, results
+    best = max(results, key=lambda r: r[1]['images_per_sec'])[0]
+    print(f'recommended: {describe(best)}')
+    return best, results
+
+
+def describe(config):
+    prefetch = 'autotune' if config['buffer_size'] == AUTOTUNE else config['buffer_size']
+    return f'batch_size {config["batch_size"]:<5} n_critic {config["n_critic"]:<3} prefetch {prefetch:<9}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='WGAN_GP', choices=['WGAN_GP', 'Augmented_WGAN_GP'])
+    parser.add_argument('--image_size', type=int, default=64)
+    parser.add_argument('--n_critic', type=int, nargs='+', default=[5])
+    parser.add_argument('--prefetch', type=int, nargs='+', default=[1, 2], help='depths besides autotune')
+    parser.add_argument('--min_batch', type=int, default=8)
+    parser.add_argument('--max_batch', type=int, default=1024)
+    parser.add_argument('--memory_mb', type=float, default=None, help='peak memory budget, only OOM by default')
+    parser.add_argument('--n_itr', type=int, default=20)
+    parser.add_argument('--epochs', type=int, default=2)
+    args = parser.parse_args()
+
+    tune(args.model, args.image_size, n_critics=args.n_critic, buffer_sizes=(*args.prefetch, AUTOTUNE),
+         min_batch=args.min_batch, max_batch=args.max_batch, memory_mb=args.memory_mb, n_itr=args.n_itr,
+         epochs=args.epochs)
+
+
+if __name__ == '__main__':
+    main()
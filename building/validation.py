@@ -0,0 +1,77 @@
+import queue
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from building.tracing import compile_step
+
+
+def copy_weights(copy, model):
+    for copy_w, w in zip(copy.variables, model.variables):
+        copy_w.assign(w)
+
+
+class AsyncValidator:
+    """Validates snapshots of G and D on a background thread, so training never waits for the validation.
+
+    `submit` copies the weights of G and D into `G_copy` and `D_copy`, built
+    like them, and queues the validation of `n_batches` batches of `dataset`
+    on the copies. Only one validation runs at a time: while it does, a new
+    one is dropped instead. `results` returns the losses of the validations
+    finished since the previous call. loss_fn(G, D, rng, x_real) is the loss
+    of one batch, with its own random generator so the training's stays as
+    it is.
+    """
+    def __init__(self, G, D, G_copy, D_copy, loss_fn, dataset, n_batches, key='images', counter=None):
+        self.G, self.D = G, D
+        self.G_copy, self.D_copy = G_copy, D_copy
+        self.loss_fn = loss_fn
+        self.dataset = dataset
+        self.n_batches = n_batches
+        self.key = key
+        self.rng = tf.random.Generator.from_non_deterministic_state()
+        self.val_step = compile_step(self.val_step, counter) if counter is not None else tf.function(self.val_step)
+        self.dropped = 0
+        self.finished = queue.Queue()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._validate, daemon=True)
+        self.thread.start()
+
+    def val_step(self, x_real):
+        return self.loss_fn(self.G_copy, self.D_copy, self.rng, x_real)
+
+    def submit(self, epoch):
+        if not self.idle.is_set():
+            self.dropped += 1
+            return
+        self.idle.clear()
+        copy_weights(self.G_copy, self.G)
+        copy_weights(self.D_copy, self.D)
+        self.queue.put(epoch)
+
+    def _validate(self):
+        while True:
+            epoch = self.queue.get()
+            if epoch is None:
+                return
+            losses = []
+            for _, batch in zip(range(self.n_batches), self.dataset):
+                losses.append(self.val_step(batch[self.key] if self.key is not None else batch))
+            if losses:
+                self.finished.put((epoch, float(np.mean([loss.numpy() for loss in losses]))))
+            self.idle.set()
+
+    def results(self):
+        """(epoch, mean loss) of every validation finished since the previous call."""
+        results = []
+        while not self.finished.empty():
+            results.append(self.finished.get())
+        return results
+
+    def close(self):
+        """Finishes the running validation, whose loss `results` then returns, and stops the thread."""
+        self.queue.put(None)
+        self.thread.join()
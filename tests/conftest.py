@@ -0,0 +1,11 @@
+import pytest
+import tensorflow as tf
+
+# logical CPU devices can only be set up before TensorFlow initializes its runtime
+_cpu = tf.config.list_physical_devices('CPU')[0]
+tf.config.set_logical_device_configuration(_cpu, [tf.config.LogicalDeviceConfiguration()] * 2)
+
+
+@pytest.fixture
+def strategy():
+    return tf.distribute.MirroredStrategy(devices=[device.name for device in tf.config.list_logical_devices('CPU')])
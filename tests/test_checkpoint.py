@@ -0,0 +1,21 @@
+import tensorflow as tf
+
+from building.checkpoint import TrainingCheckpoint
+
+
+def archived_epochs(checkpoint):
+    return [TrainingCheckpoint.epoch_of(path) for path in checkpoint.archive.checkpoints]
+
+
+def test_archives_the_first_save_past_every_boundary(tmp_path):
+    step = tf.Variable(0)
+    checkpoint = TrainingCheckpoint(str(tmp_path), keep_every=5, keep_from=3, async_write=False, step=step)
+    for epoch in range(0, 16, 3):
+        checkpoint.save(epoch)
+    assert archived_epochs(checkpoint) == [3, 6, 12, 15]
+
+    resumed = TrainingCheckpoint(str(tmp_path), keep_every=5, keep_from=3, async_write=False, step=step)
+    assert resumed.restore() == 15
+    for epoch in (18, 21):
+        resumed.save(epoch)
+    assert archived_epochs(resumed) == [3, 6, 12, 15, 21]
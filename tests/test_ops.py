@@ -0,0 +1,13 @@
+import tensorflow as tf
+
+import building.ops as ops
+
+
+def test_interpolation_follows_the_generator():
+    real, fake = tf.zeros([8, 4, 4, 3]), tf.ones([8, 4, 4, 3])
+    first = ops.interpolate(real, fake, tf.random.Generator.from_seed(1))
+    tf.random.set_seed(2)
+    second = ops.interpolate(real, fake, tf.random.Generator.from_seed(1))
+    assert first.shape == real.shape
+    assert tf.reduce_all(first == second)
+    assert tf.reduce_all((first >= 0.) & (first <= 1.))
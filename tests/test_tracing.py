@@ -0,0 +1,23 @@
+import tensorflow as tf
+
+from building.tracing import TraceCounter, compile_step
+
+
+def test_strategy_step_does_not_retrace(strategy):
+    counter = TraceCounter()
+
+    def batch_step(x_real):
+        total = strategy.run(lambda x: tf.reduce_sum(x), args=(x_real,))
+        return strategy.reduce(tf.distribute.ReduceOp.SUM, total, axis=None)
+
+    batch_step = compile_step(batch_step, counter)
+    dataset = tf.data.Dataset.from_tensor_slices(tf.ones((16, 4, 4, 3))).batch(4, drop_remainder=True)
+    iterator = iter(strategy.experimental_distribute_dataset(dataset))
+    first, second = next(iterator), next(iterator)
+    for x_real in (first, second):
+        assert float(batch_step(x_real)) == 192.
+    # the same signature as tf.function sees it on its second trace, e.g. after creating optimizer slots
+    counter.record('batch_step', (second,), {})
+    assert counter.causes == {}
+    counter.record('batch_step', (tf.ones((2, 4, 4, 3)),), {})
+    assert list(counter.causes) == ['batch_step']
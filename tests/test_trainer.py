@@ -0,0 +1,19 @@
+import numpy as np
+import tensorflow as tf
+
+from building.WGAN_GP import WGAN_GP
+from building.checkpoint import TrainingCheckpoint
+from building.housekeeping import Housekeeping
+
+
+def test_early_stopping_keeps_the_best_generator(tmp_path):
+    images = np.random.uniform(-1., 1., (32, 32, 32, 3)).astype(np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices({'images': images}).batch(8, drop_remainder=True).repeat()
+    model = WGAN_GP('t', (32, 32, 3), save_path=str(tmp_path), batch_size=8, n_critic=1, early_stopping=1)
+    # no validation loss can beat the one of the initial weights, so the first validation stops
+    model.monitor.state.best.assign(np.inf)
+    model.train(dataset, val_dataset=dataset, epochs=5, n_itr=5, fused=True,
+                housekeeping=Housekeeping(checkpoint=5, log=5, validation=5, progress=False))
+    assert TrainingCheckpoint.epoch_of(model.checkpoint.latest.latest_checkpoint) == 0
+    for best_w, w in zip(model.monitor.state.best_weights, model.G.variables):
+        assert np.array_equal(best_w.numpy(), w.numpy())
@@ -0,0 +1,14 @@
+from building.tuning import tune
+
+
+def test_tunes_augmented_model_past_batch_16():
+    # 24 and 40 do not split into the augmentor's groups of 6 evenly
+    best, results = tune('Augmented_WGAN_GP', 16, buffer_sizes=(), min_batch=10, max_batch=40, n_itr=2, epochs=1)
+    assert [config['batch_size'] for config, _ in results] == [10, 20, 40]
+    assert best is not None
+
+
+def test_failed_probe_does_not_fit():
+    # the builders cannot grow to 12 pixels, so the probe raises instead of running out of memory
+    best, results = tune('WGAN_GP', 12, buffer_sizes=(), min_batch=8, max_batch=8, n_itr=1, epochs=1)
+    assert best is None and results == []
@@ -1,5 +1,7 @@
 import os
+import queue
 import shutil
+import threading
 
 import numpy as np
 import tensorflow as tf
@@ -41,6 +43,42 @@ def save_image_grid(img_grid, epoch, model_name, output_dir):
     tf.io.write_file(output_dir, tf.image.encode_jpeg(tf.cast(img_grid, tf.uint8)))
 
 
+class SampleWriter:
+    """Merges, encodes and saves sample grids on a background thread.
+
+    `submit` only queues the (immutable) sample tensor, so training never
+    waits for the grid. When `max_pending` grids are already queued the new
+    one is dropped instead.
+    """
+    def __init__(self, n_rows=6, max_pending=2):
+        self.n_rows = n_rows
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def submit(self, samples, epoch, model_name, output_dir):
+        try:
+            self.queue.put_nowait((samples, epoch, model_name, output_dir))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            samples, epoch, model_name, output_dir = item
+            os.makedirs(output_dir, exist_ok=True)
+            image_grid = img_merge(np.asarray(samples), n_rows=self.n_rows).squeeze()
+            save_image_grid(image_grid, epoch, model_name, output_dir=output_dir)
+
+    def close(self):
+        """Writes the queued grids and stops the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+
 def get_terminal_width():
     width = shutil.get_terminal_size(fallback=(200, 24))[0]
     if width == 0:
@@ -105,47 +143,64 @@ def pbar(total_images, epoch, epochs):
     return bar
 
 
-def monitor_generator(epoch,
-                      wait,
-                      min_delta,
-                      current,
-                      best,
-                      model,
-                      mode='auto',
-                      patience=9,
-                      verbose=1,
-                      restore_best_weights=True):
-    stop_training = False
-
-    if mode not in ['auto', 'min', 'max']:
-      mode = 'auto'
-
-    if mode == 'min':
-      monitor_op = np.less
-    elif mode == 'max':
-      monitor_op = np.greater
-    else:
-        monitor_op = np.less
-
-    if monitor_op == np.greater:
-      min_delta *= 1
-    else:
-      min_delta *= -1
+class NullBar:
+    """Stands in for pbar and vbar when the progress bars are off."""
+    miniters = 10
+    n = 0
+
+    def __init__(self, *args, **kwargs):
+        self.postfix = {}
+
+    def update(self, n=1):
+        pass
+
+    def close(self):
+        pass
+
+
+class BestModelMonitor:
+    """Early stopping on a monitored value that keeps the best weights of `model` on its device.
+
+    The best weights are shadow variables next to the model's own, assigned
+    only when the value improves by more than `min_delta`, so no epoch copies
+    the model to the host. After `patience` epochs without improvement
+    `update` returns True and, with restore_best_weights, assigns the best
+    weights back. `state` holds the best weights, the best value and the
+    wait, to be passed to a TrainingCheckpoint for resuming.
+    """
+    def __init__(self, model, min_delta=0., mode='auto', patience=9, verbose=1, restore_best_weights=True):
+        self.model = model
+        self.sign = 1. if mode == 'max' else -1.
+        self.min_delta = abs(min_delta)
+        self.patience = patience
+        self.verbose = verbose
+        self.restore_best_weights = restore_best_weights
+        self.state = tf.Module(name='best_model_monitor')
+        with model.distribute_strategy.scope():
+            self.state.best_weights = [tf.Variable(w, trainable=False) for w in model.variables]
+            self.state.best = tf.Variable(-np.inf, trainable=False, dtype=tf.float64)
+            self.state.wait = tf.Variable(0, trainable=False, dtype=tf.int64)
 
-    best_weights = model.get_weights()
-
-    if monitor_op(current - min_delta, best):
-      best = current
-      wait = 0
-
-    else:
-      wait += 1
-      if wait >= patience:
-        stopped_epoch = epoch
-        stop_training = True
-        if restore_best_weights:
-          if verbose > 0:
-            print('Restoring model weights from the end of the best epoch.')
-          model.set_weights(best_weights)
-
-    return stop_training, best, wait
+    @property
+    def best(self):
+        return self.sign * float(self.state.best.numpy())
+
+    def update(self, current):
+        """Records the value of an epoch and returns whether to stop training."""
+        current = self.sign * float(current)
+        if current - self.min_delta > float(self.state.best.numpy()):
+            self.state.best.assign(current)
+            self.state.wait.assign(0)
+            for best_w, w in zip(self.state.best_weights, self.model.variables):
+                best_w.assign(w)
+            return False
+
+        self.state.wait.assign_add(1)
+        if int(self.state.wait.numpy()) < self.patience:
+            return False
+        if self.restore_best_weights:
+            if self.verbose > 0:
+                print('Restoring model weights from the end of the best epoch.')
+            for best_w, w in zip(self.state.best_weights, self.model.variables):
+                w.assign(best_w)
+        return True